@@ -0,0 +1,788 @@
+import argparse
+import asyncio
+import base64
+import csv
+import fnmatch
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from emulator import NullSink, VFSApp
+
+
+def time_per_call(func, arg, repeat):
+    """Среднее время одного вызова в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def build_chain(app, depth):
+    """Создание цепочки вложенных директорий /bench/d1/.../dN с файлом в конце"""
+    parent, parent_path = app.current_vfs, "/"
+    for name in ["bench"] + [f"d{level}" for level in range(1, depth + 1)]:
+        node = app.node_class.directory()
+        app.insert_node(parent, parent_path, name, node)
+        parent, parent_path = node, parent_path.rstrip('/') + '/' + name
+    app.insert_node(parent, parent_path, "file.txt", app.node_class.file("data", 4))
+    return parent_path
+
+
+def bench_path(args):
+    """Стоимость разрешения пути на глубине 5/50/500"""
+    print(f"{'depth':>6} {'absolute':>12} {'abs nocache':>12} {'relative':>12} {'dotdot':>12}  (us/lookup)")
+    for depth in args.depths:
+        app = VFSApp()
+        deep_path = build_chain(app, depth)
+        app.change_directory([deep_path])
+
+        absolute = deep_path + "/file.txt"
+        dotdot = "../" + deep_path.rsplit('/', 1)[-1] + "/./file.txt"
+
+        cached = time_per_call(app.resolve_path, absolute, args.repeat)
+        app.path_cache.max_entries = 0
+        app.path_cache.clear()
+        uncached = time_per_call(app.resolve_path, absolute, args.repeat)
+        relative = time_per_call(app.resolve_path, "file.txt", args.repeat)
+        parent = time_per_call(app.resolve_path, dotdot, args.repeat)
+        print(f"{depth:>6} {cached:>12.2f} {uncached:>12.2f} {relative:>12.2f} {parent:>12.2f}")
+
+
+def legacy_parse_command(command_line):
+    """Исходный посимвольный токенизатор (эталон для проверки совместимости)"""
+    tokens = []
+    current_token = ""
+    in_quotes = False
+    quote_char = None
+
+    for char in command_line:
+        if char in ['"', "'"]:
+            if not in_quotes:
+                in_quotes = True
+                quote_char = char
+            elif char == quote_char:
+                in_quotes = False
+                quote_char = None
+            else:
+                current_token += char
+        elif char == ' ' and not in_quotes:
+            if current_token:
+                tokens.append(current_token)
+                current_token = ""
+        else:
+            current_token += char
+
+    if current_token:
+        tokens.append(current_token)
+
+    if in_quotes:
+        raise ValueError("Unclosed quotes in command")
+
+    return tokens
+
+
+def tokenize_result(parse, line):
+    try:
+        return parse(line)
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+
+def random_command_line(rng, length):
+    alphabet = "abc /._-'\"\t*?["
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def bench_tokenizer(args):
+    """Проверка совместимости с исходным токенизатором и замер скорости"""
+    app = VFSApp()
+    rng = random.Random(args.seed)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = [line.rstrip('\n') for line in f]
+    corpus += [random_command_line(rng, rng.randint(0, 40)) for _ in range(args.fuzz)]
+
+    mismatches = 0
+    for line in corpus:
+        expected = tokenize_result(legacy_parse_command, line)
+        actual = tokenize_result(app.parse_command, line)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {line!r}: expected {expected!r}, got {actual!r}")
+    print(f"conformance: {len(corpus) - mismatches}/{len(corpus)} lines match")
+
+    print(f"{'length':>8} {'kind':>8} {'legacy':>12} {'new':>12}  (us/line)")
+    for length in args.lengths:
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(f'"/quoted path/{len(words)}"' if len(words) % 2 else f"/plain/arg{len(words)}")
+        quoted = " ".join(words)
+        plain = quoted.replace('"', '')
+        for kind, line in (("plain", plain), ("quoted", quoted)):
+            repeat = max(1, args.repeat * 1000 // max(length, 1))
+            legacy = time_per_call(legacy_parse_command, line, repeat)
+            new = time_per_call(app.parse_command, line, repeat)
+            print(f"{length:>8} {kind:>8} {legacy:>12.1f} {new:>12.1f}")
+    return mismatches == 0
+
+
+SESSION_COMMANDS = [
+    "ls /home/user",
+    "cd /home/user/documents",
+    "head -n 3 readme.txt",
+    "ls -l",
+    "cp notes.txt notes_{n}.txt",
+    "cd ..",
+    "ls documents",
+]
+
+
+async def run_client(path, commands):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for command in commands:
+        writer.write(command.encode('utf-8') + b'\n')
+        await writer.drain()
+        await reader.readline()
+    writer.close()
+
+
+async def measure_sessions(app, path, sessions, commands_per_session):
+    server = await app.start_server(unix_path=path)
+    commands = [SESSION_COMMANDS[i % len(SESSION_COMMANDS)].format(n=i)
+                for i in range(commands_per_session)]
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(run_client(path, commands) for _ in range(sessions)))
+    return time.perf_counter() - start
+
+
+def bench_server(args):
+    """Пропускная способность сервера при 1/10/100 одновременных сессиях"""
+    app = VFSApp(vfs_csv=args.vfs_csv, vfs_image=args.vfs_image, quiet=True)
+    path = os.path.abspath(args.socket)
+    print(f"{'sessions':>8} {'commands':>10} {'seconds':>10} {'cmd/s':>12}")
+    for sessions in args.sessions:
+        if os.path.exists(path):
+            os.remove(path)
+        elapsed = asyncio.run(measure_sessions(app, path, sessions, args.commands))
+        total = sessions * args.commands
+        print(f"{sessions:>8} {total:>10} {elapsed:>10.3f} {total / elapsed:>12.0f}")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def generate_image(path, files, fanout=100, depth=3, content_size=256, seed=1):
+    """Синтетический CSV образ: директории глубины depth с fanout элементами на уровне,
+    в каждой листовой директории до fanout файлов и пустая директория tmp.
+    Возвращает (листовые директории, файлы, пустые директории)"""
+    rng = random.Random(seed)
+    # Несколько вариантов содержимого из строк по 40 символов
+    variants = []
+    for _ in range(16):
+        text = "\n".join("".join(rng.choice("abcdefghij ") for _ in range(39))
+                         for _ in range(max(1, content_size // 40)))[:content_size]
+        variants.append((len(text.encode('utf-8')), base64.b64encode(text.encode('utf-8')).decode('ascii')))
+
+    leaves, file_paths, empty_dirs = [], [], []
+    created = set()
+    leaf_count = max(1, (files + fanout - 1) // fanout)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("path,type,perms,size,content\n")
+        for leaf in range(leaf_count):
+            # Номер листа в системе счисления по основанию fanout - путь от корня
+            parts = []
+            for level in range(depth):
+                digit = leaf // fanout ** (depth - level - 1)
+                parts.append(f"l{level}_{digit % fanout if level else digit}")
+            directory = ""
+            for part in parts:
+                directory += "/" + part
+                if directory not in created:
+                    created.add(directory)
+                    f.write(f"{directory},directory,755,,\n")
+            leaves.append(directory)
+            empty_dirs.append(directory + "/tmp")
+            f.write(f"{directory}/tmp,directory,755,,\n")
+            for number in range(leaf * fanout, min(files, (leaf + 1) * fanout)):
+                size, content = variants[number % len(variants)]
+                file_path = f"{directory}/file{number}.txt"
+                file_paths.append(file_path)
+                f.write(f"{file_path},file,644,{size},{content}\n")
+    return leaves, file_paths, empty_dirs
+
+
+def generate_script(path, leaves, file_paths, empty_dirs, commands, seed=1):
+    """Синтетический скрипт из команд ls, cd, head, cp и rmdir"""
+    rng = random.Random(seed)
+    empty_dirs = list(empty_dirs)
+    rng.shuffle(empty_dirs)
+    with open(path, 'w', encoding='utf-8') as f:
+        for number in range(commands):
+            choice = rng.random()
+            if choice < 0.25:
+                f.write(f"ls {rng.choice(leaves)}\n")
+            elif choice < 0.35:
+                f.write("ls -l\n")
+            elif choice < 0.5:
+                f.write(f"cd {rng.choice(leaves)}\n" if rng.random() < 0.8 else "cd ..\n")
+            elif choice < 0.8:
+                f.write(f"head -n {rng.randint(1, 10)} {rng.choice(file_paths)}\n")
+            elif choice < 0.95 or not empty_dirs:
+                source = rng.choice(file_paths)
+                f.write(f"cp {source} {source.rsplit('/', 1)[0]}/copy{number}.txt\n")
+            else:
+                f.write(f"rmdir {empty_dirs.pop()}\n")
+
+
+def peak_rss_kb():
+    """Пиковый объем резидентной памяти процесса (None, если недоступно)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_load(args):
+    """Время загрузки CSV в зависимости от числа процессов"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = args.vfs_csv
+        if not csv_path:
+            csv_path = os.path.join(tmp, "image.csv")
+            generate_image(csv_path, args.files, content_size=args.content_size)
+
+        print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            VFSApp(vfs_csv=csv_path, load_workers=workers, quiet=True)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.3f} {baseline / elapsed:>8.2f}")
+
+
+def bench_restart(args):
+    """Время перезапуска с сохраненным хранилищем в зависимости от длины журнала"""
+    print(f"{'records':>8} {'replay s':>10} {'snapshot s':>11}")
+    for records in args.records:
+        with tempfile.TemporaryDirectory() as store:
+            app = VFSApp(vfs_path=store, quiet=True, output=NullSink(), persist=True,
+                         snapshot_every=0, fsync_every=args.fsync_every)
+            for i in range(records):
+                app.execute(f"cp /readme.txt /copy{i}.txt")
+            app.close()
+
+            start = time.perf_counter()
+            app = VFSApp(vfs_path=store, quiet=True, output=NullSink(), persist=True, snapshot_every=0)
+            replay = time.perf_counter() - start
+            # Сжимаем журнал в снимок и измеряем перезапуск еще раз
+            app.write_snapshot()
+            app.close()
+
+            start = time.perf_counter()
+            app = VFSApp(vfs_path=store, quiet=True, output=NullSink(), persist=True, snapshot_every=0)
+            snapshot = time.perf_counter() - start
+            app.close()
+            print(f"{records:>8} {replay:>10.3f} {snapshot:>11.3f}")
+
+
+def bench_rollback(args):
+    """Повтор упавшего скрипта: откат транзакции против повторной загрузки CSV"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "image.csv")
+        _, file_paths, _ = generate_image(csv_path, args.files)
+
+        start = time.perf_counter()
+        app = VFSApp(vfs_csv=csv_path, quiet=True, output=NullSink())
+        reload = time.perf_counter() - start
+        print(f"{args.files} files, CSV load {reload:.3f} s")
+        print(f"{'changes':>8} {'script s':>10} {'rollback s':>11} {'reload s':>9}")
+        for changes in args.changes:
+            script_path = os.path.join(tmp, f"fail{changes}.vfs")
+            with open(script_path, 'w', encoding='utf-8') as f:
+                for number in range(changes):
+                    source = file_paths[number % len(file_paths)]
+                    f.write(f"cp {source} {source.rsplit('/', 1)[0]}/copy{number}.txt\n")
+                f.write("cp /missing.txt /copy.txt\n")
+
+            # Транзакция открыта заранее, чтобы измерить откат отдельно от скрипта
+            app.begin()
+            start = time.perf_counter()
+            app.run_script(script_path)
+            script = time.perf_counter() - start
+            start = time.perf_counter()
+            app.rollback()
+            rollback = time.perf_counter() - start
+            print(f"{changes:>8} {script:>10.3f} {rollback:>11.4f} {reload:>9.3f}")
+
+
+def bench_export(args):
+    """Выгрузка дерева в CSV: потоковая запись против сборки всех строк в памяти,
+    и выгрузка только изменений после загрузки"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "image.csv")
+        _, file_paths, _ = generate_image(csv_path, args.files, content_size=args.content_size)
+        app = VFSApp(vfs_csv=csv_path, quiet=True, output=NullSink())
+        for number in range(args.changes):
+            source = file_paths[number * 7 % len(file_paths)]
+            app.execute_command(f"cp {source} {source.rsplit('/', 1)[0]}/copy{number}.txt")
+        export_path = os.path.join(tmp, "export.csv")
+
+        def materialized():
+            # Все строки с полным base64 собираются в список и пишутся csv.writer
+            rows = []
+            for path, node, _ in app.walk_tree("/", app.current_vfs):
+                if path == "/":
+                    continue
+                if node.is_dir:
+                    rows.append([path, "directory", node.perms_str(), "", ""])
+                else:
+                    content = base64.b64encode(app.read_file_content(node).encode('utf-8')).decode('ascii')
+                    rows.append([path, "file", node.perms_str(), node.size, content])
+            with open(export_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(["path", "type", "perms", "size", "content"])
+                writer.writerows(rows)
+
+        cases = [
+            ("materialized", materialized),
+            ("export", lambda: app.execute_command(f"export {export_path}")),
+            ("export --diff", lambda: app.execute_command(f"export --diff {export_path}")),
+        ]
+        print(f"{args.files} files, {args.changes} changes")
+        print(f"{'command':>14} {'seconds':>10} {'peak MB':>9} {'file MB':>9}")
+        for name, func in cases:
+            elapsed, peak = measure(func)
+            size = os.path.getsize(export_path) / 2 ** 20
+            print(f"{name:>14} {elapsed:>10.3f} {peak:>9.2f} {size:>9.2f}")
+
+
+def measure(func):
+    """(секунды, пик выделенной памяти в МБ): время и память измеряются
+    отдельными вызовами, т.к. tracemalloc замедляет выделения"""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def bench_lines(args):
+    """head/tail/cat/wc на большом файле против разбиения всего содержимого split"""
+    line = "x" * (args.line_length - 1)
+    lines = args.size_mb * 2 ** 20 // args.line_length
+    content = "\n".join(f"{number:08d}{line[8:]}" for number in range(lines))
+
+    app = VFSApp(quiet=True, output=NullSink())
+    app.insert_node(app.current_vfs, "/", "big.txt", app.node_class.file(app.blobs.put(content), len(content)))
+    item = app.current_vfs.content["big.txt"]
+
+    def legacy_head():
+        app.output.write_lines(app.read_file_content(item).split('\n')[:5])
+
+    cases = [("head -n 5 (split)", legacy_head)]
+    for command in ("head -n 5", "tail -n 5", "wc -l", "wc", "cat"):
+        # execute_command пишет в NullSink, а не собирает вывод в список, как execute
+        cases.append((command, lambda command=command: app.execute_command(f"{command} /big.txt")))
+
+    # Чтение диапазона из середины файла: сканирование против индекса строк
+    middle = f"sed -n '{lines // 2},{lines // 2 + 9}p' /big.txt"
+
+    def sed_scan():
+        budget, app.line_indexes.max_bytes = app.line_indexes.max_bytes, 0
+        app.execute_command(middle)
+        app.line_indexes.max_bytes = budget
+
+    def sed_build():
+        app.line_indexes.clear()
+        app.execute_command(middle)
+
+    cases.append(("sed -n (scan)", sed_scan))
+    cases.append(("sed -n (build)", sed_build))
+    cases.append(("sed -n (indexed)", lambda: app.execute_command(middle)))
+
+    print(f"{args.size_mb} MB, {lines} lines")
+    print(f"{'command':>18} {'seconds':>10} {'peak MB':>9}")
+    for name, func in cases:
+        elapsed, peak = measure(func)
+        print(f"{name:>18} {elapsed:>10.4f} {peak:>9.2f}")
+
+
+def bench_listing(args):
+    """ls на директории с большим числом элементов: сортировка и страницы"""
+    app = VFSApp(quiet=True, output=NullSink())
+    directory = app.node_class.directory()
+    app.insert_node(app.current_vfs, "/", "big", directory)
+    rng = random.Random(args.seed)
+    for number in range(args.entries):
+        directory.content[f"file{rng.getrandbits(40):012x}.txt"] = app.node_class.file("", rng.randrange(1 << 20))
+
+    def sort_every_call():
+        # Сортировка при каждом вызове вместо хранимого списка
+        names = sorted(directory.content.items(), key=lambda item: (-item[1].size, item[0]))
+        app.output.write_lines(" ".join(name for name, _ in names[:100]).split("\n"))
+
+    middle = args.entries // 2
+    cases = [
+        ("ls", lambda: app.execute_command("ls /big")),
+        ("ls -S (build)", lambda: app.execute_command("ls -S /big")),
+        ("ls -S", lambda: app.execute_command("ls -S /big")),
+        ("sorted() per call", sort_every_call),
+        ("ls -S page", lambda: app.execute_command(f"ls -S --limit 100 --offset {middle} /big")),
+        ("ls page", lambda: app.execute_command(f"ls --limit 100 --offset {middle} /big")),
+        ("cp + ls -S page", lambda: (app.execute_command("rm -f /big/new.txt"),
+                                     app.execute_command("cp /readme.txt /big/new.txt"),
+                                     app.execute_command("ls -S --limit 100 /big"))),
+    ]
+    print(f"{args.entries} entries")
+    print(f"{'command':>18} {'ms':>10}")
+    for name, func in cases:
+        start = time.perf_counter()
+        func()
+        print(f"{name:>18} {(time.perf_counter() - start) * 1e3:>10.2f}")
+
+
+def bench_glob(args):
+    """Раскрытие шаблонов в директории с большим числом элементов"""
+    app = VFSApp(quiet=True, output=NullSink())
+    directory = app.node_class.directory()
+    app.insert_node(app.current_vfs, "/", "big", directory)
+    for number in range(args.entries):
+        directory.content[f"file{number:07d}.{'txt' if number % 2 else 'log'}"] = app.node_class.file("", 0)
+
+    def naive(pattern):
+        # Проверка каждого имени директории
+        return sorted(name for name in directory.content if fnmatch.fnmatchcase(name, pattern))
+
+    print(f"{args.entries} entries")
+    print(f"{'pattern':>22} {'matches':>8} {'naive ms':>10} {'first ms':>10} {'indexed ms':>11}")
+    for pattern in ("file00123??.txt", "file0050*", "file[0-9]*1.log", "*.txt", "file0000043.txt"):
+        start = time.perf_counter()
+        expected = naive(pattern)
+        naive_ms = (time.perf_counter() - start) * 1e3
+
+        # Первое раскрытие строит отсортированный список имен директории
+        app.listings.clear()
+        start = time.perf_counter()
+        app.expand_glob("/big/" + pattern)
+        first_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        matches = app.expand_glob("/big/" + pattern)
+        indexed_ms = (time.perf_counter() - start) * 1e3
+        assert [path.rsplit('/', 1)[-1] for path in matches] == expected, pattern
+        print(f"{pattern:>22} {len(matches):>8} {naive_ms:>10.2f} {first_ms:>10.2f} {indexed_ms:>11.2f}")
+
+
+def bench_pipeline(args):
+    """Конвейеры: head в конце останавливает обход, промежуточный вывод не копируется"""
+    line = "x" * 71
+    content = "\n".join(f"{number:08d}{line}" for number in range(args.size_mb * 2 ** 20 // 80))
+
+    app = VFSApp(quiet=True, output=NullSink())
+    app.insert_node(app.current_vfs, "/", "big.txt", app.node_class.file(app.blobs.put(content), len(content)))
+    tree = app.node_class.directory()
+    app.insert_node(app.current_vfs, "/", "tree", tree)
+    for branch in range(args.files // 1000):
+        directory = app.node_class.directory()
+        tree.content[f"d{branch}"] = directory
+        for number in range(1000):
+            directory.content[f"f{number}.txt"] = app.node_class.file("", 0)
+
+    cases = [
+        ("find /tree", "find /tree"),
+        ("find | head -n 10", "find /tree | head -n 10"),
+        ("cat | grep | wc -l", "cat /big.txt | grep 5$ | wc -l"),
+        ("cat | tail -n 5", "cat /big.txt | tail -n 5"),
+        ("cat > copy", "cat /big.txt > /copy.txt"),
+    ]
+    print(f"{args.size_mb} MB file, {args.files // 1000 * 1000} files in tree")
+    print(f"{'command':>20} {'seconds':>10} {'peak MB':>9}")
+    for name, command in cases:
+        elapsed, peak = measure(lambda: app.execute_command(command))
+        print(f"{name:>20} {elapsed:>10.4f} {peak:>9.2f}")
+
+
+def bench_batch(args):
+    """Пакетный режим: один скрипт в каждой домашней директории при разном числе процессов"""
+    app = VFSApp(quiet=True, output=NullSink())
+    homes = app.node_class.directory()
+    app.insert_node(app.current_vfs, "/", "homes", homes)
+    content = "\n".join(f"line {number}" for number in range(args.lines))
+    for user in range(args.users):
+        home = app.node_class.directory()
+        homes.content[f"user{user}"] = home
+        for number in range(10):
+            home.content[f"file{number}.txt"] = app.node_class.file(app.blobs.put(content), len(content))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        script_path = os.path.join(tmp, "job.vfs")
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write("grep -c 7 file0.txt\ncat file1.txt | grep 99 | wc -l\n"
+                    "tail -n 5 file2.txt > last.txt\ncp file3.txt copy.txt\nrm file4.txt\n")
+
+        print(f"{args.users} users, {args.lines} lines per file, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>10} {'runs/s':>10}")
+        for workers in args.workers:
+            session = app.fork_session(NullSink())
+            start = time.perf_counter()
+            session.run_batch([script_path], ["/homes/*"], workers)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:>10.3f} {args.users / elapsed:>10.1f}")
+
+
+def generate_deep_image(path, depth, files, branches=4, shuffle=False, seed=1):
+    """CSV с цепочками директорий глубины depth: файлы лежат на нижних уровнях.
+    shuffle - строки в случайном порядке (промежуточные директории создаются загрузчиком)"""
+    rng = random.Random(seed)
+    rows = []
+    per_branch = max(1, files // branches)
+    for branch in range(branches):
+        directory = f"/b{branch}"
+        rows.append(f"{directory},directory,755,,")
+        for level in range(1, depth):
+            directory += f"/d{level}"
+            rows.append(f"{directory},directory,755,,")
+            # Файлы распределены по последним десяти уровням цепочки
+            if level >= depth - 10:
+                for number in range(per_branch // 10):
+                    rows.append(f"{directory}/f{number}.txt,file,644,4,ZGF0YQ==")
+    if shuffle:
+        rng.shuffle(rows)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("path,type,perms,size,content\n")
+        f.write("\n".join(rows) + "\n")
+    return len(rows)
+
+
+def bench_bulkload(args):
+    """Загрузка глубокого CSV: курсор предков против поиска родителя от корня"""
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'depth':>6} {'order':>9} {'rows':>8} {'root walk s':>12} {'cursor s':>10} {'speedup':>8}")
+        for depth in args.depths:
+            for shuffle in (False, True):
+                csv_path = os.path.join(tmp, "deep.csv")
+                rows = generate_deep_image(csv_path, depth, args.files, shuffle=shuffle)
+                times = []
+                for cursor in (False, True):
+                    app = VFSApp(quiet=True, output=NullSink())
+                    app.vfs_csv = csv_path
+                    app.use_load_cursor = cursor # False - поиск каждой строки от корня
+                    start = time.perf_counter()
+                    app.load_vfs_from_csv()
+                    times.append(time.perf_counter() - start)
+                order = "shuffled" if shuffle else "sorted"
+                print(f"{depth:>6} {order:>9} {rows:>8} {times[0]:>12.3f} {times[1]:>10.3f} "
+                      f"{times[0] / times[1]:>8.2f}")
+
+
+def bench_generate(args):
+    """Запись синтетического образа и скрипта для запуска emulator.py"""
+    leaves, file_paths, empty_dirs = generate_image(args.csv, args.files, args.fanout, args.depth,
+                                                    args.content_size, args.seed)
+    if args.script:
+        generate_script(args.script, leaves, file_paths, empty_dirs, args.commands, args.seed)
+    print(f"{args.csv}: {len(leaves)} leaf directories, {len(file_paths)} files")
+
+
+def run_suite(args, tmp):
+    csv_path = os.path.join(tmp, "image.csv")
+    script_path = os.path.join(tmp, "script.vfs")
+    leaves, file_paths, empty_dirs = generate_image(csv_path, args.files, args.fanout, args.depth,
+                                                    args.content_size, args.seed)
+    generate_script(script_path, leaves, file_paths, empty_dirs, args.commands, args.seed)
+
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    app = VFSApp(vfs_csv=csv_path, quiet=True, output=NullSink(),
+                 profile=os.path.join(tmp, "profile.json"))
+    load_seconds = time.perf_counter() - start
+    rss_loaded = peak_rss_kb()
+
+    start = time.perf_counter()
+    completed = app.run_script(script_path)
+    script_seconds = time.perf_counter() - start
+    report = app.profiler.report()
+    commands = sum(stats["count"] for stats in report["commands"].values())
+
+    return {
+        "config": {"files": args.files, "fanout": args.fanout, "depth": args.depth,
+                   "content_size": args.content_size, "commands": args.commands, "seed": args.seed},
+        "load_seconds": round(load_seconds, 4),
+        "load_phases_ms": report["load_phases_ms"],
+        "rss_kb": {"before_load": rss_before, "after_load": rss_loaded, "peak": peak_rss_kb()},
+        "script": {"completed": completed, "commands": commands, "seconds": round(script_seconds, 4),
+                   "commands_per_second": round(commands / script_seconds, 1) if script_seconds else None},
+        "commands": {name: {"count": stats["count"], "mean_us": stats["mean_us"],
+                            "histogram_us": stats["histogram_us"]}
+                     for name, stats in report["commands"].items()},
+        "lookups": report["lookups"],
+    }
+
+
+def compare_results(results, baseline, tolerance):
+    """Список регрессий относительно сохраненных результатов"""
+    regressions = []
+    if results["load_seconds"] > baseline["load_seconds"] * (1 + tolerance):
+        regressions.append(f"load: {baseline['load_seconds']}s -> {results['load_seconds']}s")
+    old_rate = baseline["script"]["commands_per_second"]
+    new_rate = results["script"]["commands_per_second"]
+    if old_rate and new_rate and new_rate < old_rate / (1 + tolerance):
+        regressions.append(f"script throughput: {old_rate} -> {new_rate} cmd/s")
+    for name, stats in results["commands"].items():
+        old = baseline["commands"].get(name)
+        if old and stats["mean_us"] > old["mean_us"] * (1 + tolerance):
+            regressions.append(f"{name}: {old['mean_us']} -> {stats['mean_us']} us mean")
+    return regressions
+
+
+def bench_suite(args):
+    """Загрузка, память, задержки команд и пропускная способность скрипта на синтетических данных"""
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        results = run_suite(args, args.keep)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_suite(args, tmp)
+
+    script = results["script"]
+    print(f"load: {results['load_seconds']} s, peak RSS: {results['rss_kb']['peak']} KB")
+    print(f"script: {script['commands']} commands in {script['seconds']} s "
+          f"({script['commands_per_second']} cmd/s)")
+    for name, stats in sorted(results["commands"].items()):
+        print(f"  {name:>6}: {stats['count']:>8} calls, {stats['mean_us']:>10} us mean")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return not regressions
+    return True
+
+
+def add_image_arguments(parser):
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--fanout', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--content-size', type=int, default=256)
+    parser.add_argument('--commands', type=int, default=100000, help='Synthetic script length')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='VFS Emulator benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    path_parser = subparsers.add_parser('path', help='Path resolution cost by depth')
+    path_parser.add_argument('--depths', type=int, nargs='+', default=[5, 50, 500])
+    path_parser.add_argument('--repeat', type=int, default=20000)
+    path_parser.set_defaults(func=bench_path)
+
+    tokenizer_parser = subparsers.add_parser('tokenizer', help='Tokenizer conformance and speed')
+    tokenizer_parser.add_argument('--corpus', default='tokenizer_corpus.txt')
+    tokenizer_parser.add_argument('--fuzz', type=int, default=5000,
+                                  help='Number of random lines added to the corpus')
+    tokenizer_parser.add_argument('--seed', type=int, default=1)
+    tokenizer_parser.add_argument('--lengths', type=int, nargs='+', default=[1000, 100000])
+    tokenizer_parser.add_argument('--repeat', type=int, default=20)
+    tokenizer_parser.set_defaults(func=bench_tokenizer)
+
+    server_parser = subparsers.add_parser('server', help='Server throughput by concurrent sessions')
+    server_parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 100])
+    server_parser.add_argument('--commands', type=int, default=1000,
+                               help='Commands sent by each session')
+    server_parser.add_argument('--socket', default='bench_server.sock')
+    server_parser.add_argument('--vfs-csv', type=str)
+    server_parser.add_argument('--vfs-image', type=str)
+    server_parser.set_defaults(func=bench_server)
+
+    load_parser = subparsers.add_parser('load', help='CSV load time by number of worker processes')
+    load_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    load_parser.add_argument('--files', type=int, default=200000)
+    load_parser.add_argument('--content-size', type=int, default=256)
+    load_parser.add_argument('--vfs-csv', type=str, help='Use an existing CSV instead of a synthetic one')
+    load_parser.set_defaults(func=bench_load)
+
+    restart_parser = subparsers.add_parser('restart', help='Restart time by persisted journal length')
+    restart_parser.add_argument('--records', type=int, nargs='+', default=[0, 1000, 10000, 100000])
+    restart_parser.add_argument('--fsync-every', type=int, default=0,
+                                help='fsync batching while the journal is written')
+    restart_parser.set_defaults(func=bench_restart)
+
+    rollback_parser = subparsers.add_parser('rollback', help='Transaction rollback versus CSV reload by change count')
+    rollback_parser.add_argument('--files', type=int, default=200000)
+    rollback_parser.add_argument('--changes', type=int, nargs='+', default=[10, 1000, 10000])
+    rollback_parser.set_defaults(func=bench_rollback)
+
+    export_parser = subparsers.add_parser('export', help='CSV export of the whole tree and of changes only')
+    export_parser.add_argument('--files', type=int, default=200000)
+    export_parser.add_argument('--changes', type=int, default=1000)
+    export_parser.add_argument('--content-size', type=int, default=256)
+    export_parser.set_defaults(func=bench_export)
+
+    lines_parser = subparsers.add_parser('lines', help='head/tail/cat/wc on a large file')
+    lines_parser.add_argument('--size-mb', type=int, default=100)
+    lines_parser.add_argument('--line-length', type=int, default=80)
+    lines_parser.set_defaults(func=bench_lines)
+
+    listing_parser = subparsers.add_parser('listing', help='ls sorting and pagination on a huge directory')
+    listing_parser.add_argument('--entries', type=int, default=1000000)
+    listing_parser.add_argument('--seed', type=int, default=1)
+    listing_parser.set_defaults(func=bench_listing)
+
+    glob_parser = subparsers.add_parser('glob', help='Wildcard expansion on a huge directory')
+    glob_parser.add_argument('--entries', type=int, default=200000)
+    glob_parser.set_defaults(func=bench_glob)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='Pipelines and redirection on a large file and tree')
+    pipeline_parser.add_argument('--size-mb', type=int, default=50)
+    pipeline_parser.add_argument('--files', type=int, default=200000)
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    batch_parser = subparsers.add_parser('batch', help='Batch script runs over home directories by worker count')
+    batch_parser.add_argument('--users', type=int, default=2000)
+    batch_parser.add_argument('--lines', type=int, default=2000)
+    batch_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    batch_parser.set_defaults(func=bench_batch)
+
+    bulkload_parser = subparsers.add_parser('bulkload', help='CSV load on deep sorted and shuffled images')
+    bulkload_parser.add_argument('--depths', type=int, nargs='+', default=[5, 50, 200])
+    bulkload_parser.add_argument('--files', type=int, default=100000)
+    bulkload_parser.set_defaults(func=bench_bulkload)
+
+    generate_parser = subparsers.add_parser('generate', help='Write a synthetic CSV image and script')
+    generate_parser.add_argument('csv', help='Output CSV path')
+    generate_parser.add_argument('--script', type=str, help='Output script path')
+    add_image_arguments(generate_parser)
+    generate_parser.set_defaults(func=bench_generate)
+
+    suite_parser = subparsers.add_parser('suite', help='Full benchmark on synthetic data with JSON results')
+    add_image_arguments(suite_parser)
+    suite_parser.add_argument('--output', '-o', type=str, help='Write results as JSON')
+    suite_parser.add_argument('--compare', type=str, help='Fail on regressions against a results JSON')
+    suite_parser.add_argument('--tolerance', type=float, default=0.2,
+                              help='Allowed slowdown against --compare (0.2 = 20%%)')
+    suite_parser.add_argument('--keep', type=str, help='Keep generated files in this directory')
+    suite_parser.set_defaults(func=bench_suite)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.func(args) is False:
+        sys.exit(1)
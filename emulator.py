@@ -1,46 +1,1180 @@
 import argparse
+import array
+import asyncio
+import copy
+import io
+import itertools
+import json
 import os
 import getpass
 import socket
 import csv
+import fnmatch
 import base64
+import bisect
+import hashlib
+import mmap
+import multiprocessing
+import pickle
+import re
+import struct
 import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 
-class VFSApp: # Запуск в терминале: python3 emulator.py
-    def __init__(self, vfs_path='./vfs_root', script_path=None, vfs_csv=None):
+compiled_scripts = OrderedDict() # Скомпилированные скрипты по SHA-256 содержимого (LRU)
+# Скомпилированных скриптов в памяти процесса: сервер и пакетный режим
+# за время работы выполняют много разных скриптов
+COMPILED_SCRIPTS_MAX = 256
+# Версия формата скомпилированного скрипта: увеличивается при изменении разбора
+# (шаблоны путей, конвейеры), чтобы старый кэш не использовался
+SCRIPT_FORMAT = 3
+batch_app = None # Загруженное дерево для процессов пакетного режима
+
+# Операторы конвейера и перенаправления вывода вне кавычек
+PIPE_OPERATOR = re.compile(r'\|\|?|>>?')
+# Команда-конвейер в скомпилированном скрипте: аргументы - [команды, перенаправление]
+PIPELINE = "|"
+
+# Символы шаблонов путей (*, ?, [...])
+GLOB_CHARS = re.compile(r'[*?[]')
+
+# Строк вывода в одной записи в приемник при обходе дерева (find, du)
+STREAM_BATCH = 1024
+
+# Строка в кавычках "..." или '...'; re.split дает [текст, "", '', текст, "", '', ..., текст]
+QUOTED_PATTERN = re.compile(r""""([^"]*)"|'([^']*)'""")
+
+
+class GlobPattern(str):
+    """Аргумент с символами шаблона вне кавычек. Значение - текст аргумента,
+    pattern - шаблон fnmatch, в котором символы из кавычек экранированы"""
+    def __new__(cls, text, pattern):
+        token = super().__new__(cls, text)
+        token.pattern = pattern
+        return token
+
+    def __reduce__(self):
+        return GlobPattern, (str(self), self.pattern)
+
+
+class ScriptUnpickler(pickle.Unpickler):
+    """Чтение кэша скомпилированного скрипта: из классов разрешен только GlobPattern,
+    поэтому подмененный файл кэша не может выполнить произвольный код"""
+    def find_class(self, module, name):
+        if name == "GlobPattern" and module in ("__main__", __name__):
+            return GlobPattern
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in script cache")
+
+
+def glob_escape(text):
+    """Экранирование символов шаблона, чтобы они совпадали только сами с собой"""
+    return GLOB_CHARS.sub(r'[\g<0>]', text)
+
+
+class VFSNode:
+    """Узел VFS: директория (content - словарь имя -> узел) или файл (content - данные)"""
+    __slots__ = ('is_dir', 'perms', 'size', 'content')
+
+    def __init__(self, is_dir, perms, size, content):
+        self.is_dir = is_dir # True для директории
+        self.perms = perms # Права доступа как число (0o755)
+        self.size = size # Размер файла из CSV (у директорий 0)
+        self.content = content # Дочерние узлы или содержимое файла
+
+    @classmethod
+    def directory(cls, children=None, perms=0o755):
+        return cls(True, perms, 0, children if children is not None else {})
+
+    @classmethod
+    def file(cls, content="", size=0, perms=0o644):
+        return cls(False, perms, size, content)
+
+    @property
+    def type(self):
+        return "directory" if self.is_dir else "file"
+
+    def perms_str(self):
+        return format(self.perms, 'o')
+
+    def to_legacy_dict(self):
+        """Представление узла в старом формате словаря (без дочерних узлов)"""
+        if self.is_dir:
+            return {"type": "directory", "content": dict.fromkeys(self.content), "perms": self.perms_str()}
+        return {"type": "file", "size": self.size, "content": self.content, "perms": self.perms_str()}
+
+
+def parse_perms(perms, default):
+    """Преобразование строки прав ('644') в число; пустая строка - права по умолчанию,
+    None - строка не является восьмеричными правами"""
+    if not perms:
+        return default
+    try:
+        value = int(perms, 8)
+    except ValueError:
+        return None
+    # Права вместе с флагами хранятся в 16 битах записи образа
+    return value if 0 <= value <= 0o7777 else None
+
+
+def row_from_values(fieldnames, values):
+    """Сопоставление значений строки CSV с заголовками, как в csv.DictReader"""
+    row = dict(zip(fieldnames, values))
+    if len(values) > len(fieldnames):
+        row[None] = values[len(fieldnames):]
+    for name in fieldnames[len(values):]:
+        row[name] = None
+    return row
+
+
+def csv_row_error(row):
+    """Проверка строки CSV: текст ошибки или None"""
+    required_fields = ['path', 'type']
+    for field in required_fields:
+        if field not in row or not row[field]:
+            return f"missing required field '{field}'"
+
+    if row['type'] not in ['file', 'directory', 'removed']:
+        return "type must be 'file', 'directory' or 'removed'"
+
+    return None
+
+
+def csv_field(text):
+    """Поле CSV в кавычках, если это нужно (как QUOTE_MINIMAL у csv.writer)"""
+    if ',' in text or '"' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def decode_content(content_b64):
+    """Декодирование содержимого файла из base64"""
+    return base64.b64decode(content_b64).decode('utf-8') if content_b64 else ""
+
+
+def parse_csv_chunk(csv_path, fieldnames, start, end):
+    """Разбор диапазона байт CSV в процессе-обработчике.
+    Возвращает (число строк, [(номер строки в диапазоне, ошибка, запись)])"""
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+
+    entries = []
+    row_num = 0
+    for values in csv.reader(io.StringIO(data, newline='')):
+        if not values:
+            # Пустые строки пропускаются, как в csv.DictReader
+            continue
+        row_num += 1
+        row = row_from_values(fieldnames, values)
+        error = csv_row_error(row)
+        if error:
+            entries.append((row_num, error, None))
+            continue
+
+        item_type = row['type'].strip()
+        size, content = 0, ""
+        if item_type == 'file':
+            size = int(row.get('size', 0))
+            content = decode_content(row.get('content', ''))
+        entries.append((row_num, None, (row['path'].strip(), item_type,
+                                        row.get('perms', '644').strip(), size, content)))
+    return row_num, entries
+
+
+class LazyContent:
+    """Ссылка на содержимое файла внутри CSV: смещение и длина строки в байтах"""
+    __slots__ = ('offset', 'length')
+
+    def __init__(self, offset, length):
+        self.offset = offset # Смещение начала строки CSV
+        self.length = length # Длина строки CSV в байтах
+
+
+class Blob:
+    """Содержимое файла в хранилище блобов: одно на каждое уникальное содержимое"""
+    __slots__ = ('digest', 'data')
+
+    def __init__(self, digest, data):
+        self.digest = digest # SHA-256 содержимого
+        self.data = data # Декодированное содержимое
+
+
+class BlobStore:
+    """Хранилище содержимого файлов по хешу со счетчиками ссылок: одинаковые файлы
+    и копии (cp) ссылаются на один Blob"""
+    def __init__(self):
+        self.blobs = {} # хеш -> Blob
+        self.refs = {} # хеш -> число файлов, ссылающихся на содержимое
+
+    def put(self, data):
+        """Blob для содержимого (существующий, если такое содержимое уже есть)"""
+        digest = hashlib.sha256(data.encode('utf-8')).digest()
+        blob = self.blobs.get(digest)
+        if blob is None:
+            blob = self.blobs[digest] = Blob(digest, data)
+        self.refs[digest] = self.refs.get(digest, 0) + 1
+        return blob
+
+    def acquire(self, blob):
+        """Новая ссылка на существующий Blob (копирование файла)"""
+        self.blobs.setdefault(blob.digest, blob)
+        self.refs[blob.digest] = self.refs.get(blob.digest, 0) + 1
+        return blob
+
+    def release(self, blob):
+        """Удаление ссылки; содержимое без ссылок освобождается"""
+        refs = self.refs.get(blob.digest)
+        if refs is None:
+            return  # Blob другого хранилища (дерево, общее с другой сессией)
+        if refs > 1:
+            self.refs[blob.digest] = refs - 1
+        else:
+            del self.refs[blob.digest]
+            del self.blobs[blob.digest]
+
+    def stats(self):
+        """(уникальных блобов, их объем в байтах, ссылок на них)"""
+        return (len(self.blobs), sum(len(blob.data) for blob in self.blobs.values()),
+                sum(self.refs.values()))
+
+
+def listing_size(listing):
+    """Примерный объем отсортированного списка директории в байтах"""
+    if listing and isinstance(listing[0], tuple):
+        return len(listing) * 96 # ссылка + кортеж (-размер, имя) + число
+    return len(listing) * 8 # ссылка на имя
+
+
+class ContentView:
+    """Содержимое файла для построчного чтения без копирования: строка в памяти
+    или диапазон [start, end) отображенного в память образа"""
+    __slots__ = ('buffer', 'start', 'end', 'newline')
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer # str или mmap
+        self.start = start
+        self.end = end
+        self.newline = '\n' if isinstance(buffer, str) else b'\n'
+
+    def text(self, start, end):
+        data = self.buffer[start:end]
+        return data if isinstance(data, str) else data.decode('utf-8')
+
+    def lines(self):
+        """Строки по порядку (как content.split('\\n')), поиск останавливается
+        вместе с потребителем"""
+        buffer, newline, end = self.buffer, self.newline, self.end
+        pos = self.start
+        while True:
+            index = buffer.find(newline, pos, end)
+            if index < 0:
+                yield self.text(pos, end)
+                return
+            yield self.text(pos, index)
+            pos = index + 1
+
+    def lines_reversed(self):
+        """Строки от последней к первой: поиск идет назад от конца файла"""
+        buffer, newline, start = self.buffer, self.newline, self.start
+        pos = self.end
+        while True:
+            index = buffer.rfind(newline, start, pos)
+            if index < 0:
+                yield self.text(start, pos)
+                return
+            yield self.text(index + 1, pos)
+            pos = index
+
+    def chunks(self, size=64 * 1024):
+        """Блоки текста около size символов, заканчивающиеся на границе строки"""
+        buffer, newline, end = self.buffer, self.newline, self.end
+        pos = self.start
+        while pos < end:
+            index = buffer.find(newline, min(pos + size, end), end)
+            stop = end if index < 0 else index + 1
+            yield self.text(pos, stop)
+            pos = stop
+
+    def byte_chunks(self, size=3 * 64 * 1024):
+        """Содержимое в UTF-8 блоками по size символов (байт для mmap)"""
+        for pos in range(self.start, self.end, size):
+            data = self.buffer[pos:min(pos + size, self.end)]
+            yield data.encode('utf-8') if isinstance(data, str) else data
+
+    def line_starts(self):
+        """Индекс строк: смещения начала каждой строки относительно start"""
+        buffer, newline, start, end = self.buffer, self.newline, self.start, self.end
+        starts = array.array('Q', [0])
+        pos = buffer.find(newline, start, end)
+        while pos >= 0:
+            starts.append(pos + 1 - start)
+            pos = buffer.find(newline, pos + 1, end)
+        return starts
+
+    def line_range(self, starts, first, last):
+        """Строки first..last (с 1, включительно) по индексу строк без сканирования"""
+        begin = self.start + starts[first - 1]
+        # Конец диапазона - перевод строки перед началом следующей строки
+        stop = self.start + starts[last] - 1 if last < len(starts) else self.end
+        return ContentView(self.buffer, begin, stop).lines()
+
+    def line_count(self):
+        """Число переводов строк (без создания строк)"""
+        if isinstance(self.buffer, str):
+            return self.buffer.count(self.newline, self.start, self.end)
+        # У mmap нет count - считаем по блокам фиксированного размера
+        return sum(self.buffer[pos:min(pos + 1024 * 1024, self.end)].count(self.newline)
+                   for pos in range(self.start, self.end, 1024 * 1024))
+
+
+class ContentCache:
+    """LRU-кэш декодированного содержимого с ограничением по объему"""
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes # Максимальный объем кэша в байтах (0 - без кэша)
+        self.sizeof = sizeof # Объем значения в байтах
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            # Слишком большое содержимое не кэшируем
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used_bytes -= self.sizeof(old)
+        self.entries[key] = value
+        self.used_bytes += size
+        self.evict()
+
+    def resize(self, delta):
+        """Учет изменения объема записи, измененной на месте"""
+        self.used_bytes += delta
+        self.evict()
+
+    def discard(self, key):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.used_bytes -= self.sizeof(value)
+
+    def evict(self):
+        # Вытесняем самые давно использованные записи
+        while self.used_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.used_bytes -= self.sizeof(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+
+class OutputSink:
+    """Приемник вывода команд: построчная запись без буферизации в stdout"""
+    def write(self, text):
+        print(text)
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_stream(self, lines):
+        """Запись строк генератора пачками по мере их вычисления"""
+        batch = []
+        try:
+            for line in lines:
+                batch.append(line)
+                if len(batch) >= STREAM_BATCH:
+                    self.write_lines(batch)
+                    batch = []
+        finally:
+            # Вычисленное до прерывания (Ctrl+C) тоже выводится
+            if batch:
+                self.write_lines(batch)
+
+    def flush(self):
+        pass
+
+
+class BufferedSink(OutputSink):
+    """Буферизованный вывод в поток: запись одним вызовом при накоплении flush_size символов"""
+    def __init__(self, stream=None, flush_size=64 * 1024):
+        self.stream = stream if stream is not None else sys.stdout
+        self.flush_size = flush_size # Размер буфера (0 - сбрасывать каждую строку)
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.size += len(text) + 1
+        if self.size >= self.flush_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.buffer.append(line)
+            self.size += len(line) + 1
+        if self.size >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append("")
+            self.stream.write("\n".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        self.stream.flush()
+
+
+class CaptureSink(OutputSink):
+    """Сохранение вывода в список строк (для встраивания)"""
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def write_lines(self, lines):
+        self.lines.extend(lines)
+
+
+class PipeSink(OutputSink):
+    """Вывод команды внутри конвейера: строки и генераторы строк сохраняются
+    без вычисления и читаются следующей командой по мере надобности"""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append((text,))
+
+    def write_lines(self, lines):
+        self.parts.append(lines)
+
+    def write_stream(self, lines):
+        self.parts.append(lines)
+
+    def lines(self):
+        return itertools.chain.from_iterable(self.parts)
+
+
+class NullSink(OutputSink):
+    """Отбрасывание вывода (для замеров производительности)"""
+    def write(self, text):
+        pass
+
+    def write_lines(self, lines):
+        for _ in lines:
+            pass
+
+
+class PhaseTimer:
+    """Накопление времени по фазам: mark(фаза) относит к фазе время с прошлой отметки"""
+    def __init__(self, phases):
+        self.phases = phases
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+
+class Profiler:
+    """Счетчики профилирования: фазы загрузки, задержки команд, обходы дерева"""
+    def __init__(self):
+        self.phases = {} # фаза -> секунды
+        self.commands = {} # команда -> [число вызовов, суммарное время, гистограмма]
+        self.walks = 0 # обходов дерева от корня
+        self.walk_steps = 0 # пройдено узлов при обходах
+        self.walk_max_depth = 0
+        # Как разрешались пути: кэш, индекс, обход от корня, от текущей директории
+        self.lookups = {"cache": 0, "index": 0, "walk": 0, "relative": 0}
+
+    def phase_timer(self):
+        return PhaseTimer(self.phases)
+
+    def record_command(self, command, seconds):
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = [0, 0.0, {}]
+        stats[0] += 1
+        stats[1] += seconds
+        # Корзины гистограммы - степени двойки в микросекундах
+        bucket = int(seconds * 1e6).bit_length()
+        stats[2][bucket] = stats[2].get(bucket, 0) + 1
+
+    def record_walk(self, depth, steps):
+        self.walks += 1
+        self.walk_steps += steps
+        if depth > self.walk_max_depth:
+            self.walk_max_depth = depth
+
+    def report(self):
+        commands = {}
+        for command, (count, total, histogram) in self.commands.items():
+            commands[command] = {
+                "count": count,
+                "total_ms": round(total * 1e3, 3),
+                "mean_us": round(total / count * 1e6, 2),
+                # "<=N": число команд с задержкой до N мкс
+                "histogram_us": {f"<={(1 << bucket) - 1}": histogram[bucket] for bucket in sorted(histogram)},
+            }
+        return {
+            "load_phases_ms": {phase: round(seconds * 1e3, 3) for phase, seconds in self.phases.items()},
+            "commands": commands,
+            "lookups": dict(self.lookups),
+            "walks": {"count": self.walks, "steps": self.walk_steps, "max_depth": self.walk_max_depth},
+        }
+
 
+# Коды завершения команд
+EXIT_OK = 0
+EXIT_FAILURE = 1 # команда сообщила об ошибке
+EXIT_SYNTAX = 2 # синтаксическая ошибка (незакрытые кавычки)
+EXIT_UNKNOWN = 127 # неизвестная команда
+
+
+class CommandResult:
+    """Результат VFSApp.execute: код завершения и строки вывода"""
+    __slots__ = ('code', 'output', 'exit')
+
+    def __init__(self, code, output, exit=False):
+        self.code = code # Код завершения (EXIT_*)
+        self.output = output # Строки вывода команды
+        self.exit = exit # Была выполнена команда exit
+
+    @property
+    def ok(self):
+        return self.code == EXIT_OK
+
+    def __repr__(self):
+        return f"CommandResult(code={self.code}, output={self.output!r}, exit={self.exit})"
+
+
+class PathCache:
+    """LRU-кэш разрешенных путей: абсолютный путь -> узел"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries # Максимальное число путей (0 - без кэша)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, path):
+        node = self.entries.get(path)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(path)
+        return node
+
+    def put(self, path, node):
+        if not self.max_entries:
+            return
+        self.entries[path] = node
+        self.entries.move_to_end(path)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, path, recursive=False):
+        """Удаление пути (и при recursive - всех вложенных путей) из кэша"""
+        if self.entries.pop(path, None) is not None:
+            self.invalidations += 1
+        if recursive:
+            prefix = path.rstrip('/') + '/'
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        self.entries.clear()
+
+
+def child_path(parent_path, name):
+    """Полный путь дочернего элемента директории"""
+    return parent_path.rstrip('/') + '/' + name
+
+
+# Бинарный образ VFS:
+#   заголовок | таблица узлов | таблица строк | блок содержимого | хеш-индекс путей
+# Узлы записаны в порядке обхода в ширину, поэтому дочерние элементы директории
+# занимают непрерывный диапазон [first_child, first_child + child_count).
+IMAGE_MAGIC = b'VFSIMG01'
+IMAGE_HEADER = struct.Struct('<8sIQQQQQQQQ')
+# parent, name_off, name_len, flags (бит 16 - директория, младшие биты - права), size,
+# first_child/content_off, child_count/content_len
+IMAGE_NODE = struct.Struct('<IIIIQQQ')
+IMAGE_INDEX_ENTRY = struct.Struct('<QI')
+IMAGE_DIR_FLAG = 1 << 16
+
+
+def path_hash(path):
+    """Стабильный между процессами 64-битный хеш пути"""
+    return int.from_bytes(hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class ImageContent:
+    """Ссылка на содержимое файла в блоке содержимого бинарного образа"""
+    __slots__ = ('offset', 'length')
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+class ImageNode(VFSNode):
+    """Директория из образа: дочерние узлы читаются из mmap при первом обращении"""
+    __slots__ = ('image', 'index')
+
+    def __init__(self, image, index, perms):
+        super().__init__(True, perms, 0, None)
+        self.image = image # VFSImage, из которого читается директория
+        self.index = index # Номер узла в таблице образа
+
+    @property
+    def content(self):
+        children = VFSNode.content.__get__(self)
+        if children is None:
+            # Словарь в памяти служит copy-on-write слоем поверх образа
+            children = self.image.children(self.index)
+            VFSNode.content.__set__(self, children)
+        return children
+
+    @content.setter
+    def content(self, value):
+        VFSNode.content.__set__(self, value)
+
+
+class VFSImage:
+    """Бинарный образ VFS, отображенный в память только для чтения"""
+    def __init__(self, image_path, node_class=VFSNode):
+        self.image_path = image_path
+        self.node_class = node_class
+        with open(image_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, _, self.node_count, self.nodes_off, self.strings_off, _,
+         self.blob_off, _, self.index_off, self.index_capacity) = IMAGE_HEADER.unpack_from(self.mm, 0)
+        if magic != IMAGE_MAGIC:
+            raise ValueError(f"{image_path} is not a VFS image")
+        self.nodes = {} # Уже созданные узлы: номер -> узел (один объект на узел образа)
+
+    def record(self, index):
+        return IMAGE_NODE.unpack_from(self.mm, self.nodes_off + index * IMAGE_NODE.size)
+
+    def name(self, record):
+        start = self.strings_off + record[1]
+        return sys.intern(self.mm[start:start + record[2]].decode('utf-8'))
+
+    def node(self, index, record=None):
+        """Узел VFS для записи образа (создается один раз)"""
+        node = self.nodes.get(index)
+        if node is None:
+            if record is None:
+                record = self.record(index)
+            flags = record[3]
+            if flags & IMAGE_DIR_FLAG:
+                node = ImageNode(self, index, flags & 0xFFFF)
+            else:
+                node = self.node_class.file(ImageContent(record[5], record[6]), record[4], flags & 0xFFFF)
+            self.nodes[index] = node
+        return node
+
+    def children(self, index):
+        record = self.record(index)
+        first, count = record[5], record[6]
+        children = {}
+        for child in range(first, first + count):
+            child_record = self.record(child)
+            children[self.name(child_record)] = self.node(child, child_record)
+        return children
+
+    def read(self, content):
+        start = self.blob_off + content.offset
+        return self.mm[start:start + content.length].decode('utf-8')
+
+    def lookup(self, path):
+        """Поиск узла по полному пути через хеш-индекс образа"""
+        h = path_hash(path)
+        mask = self.index_capacity - 1
+        slot = h & mask
+        name = path.rsplit('/', 1)[-1]
+        while True:
+            entry_hash, entry = IMAGE_INDEX_ENTRY.unpack_from(
+                self.mm, self.index_off + slot * IMAGE_INDEX_ENTRY.size)
+            if not entry:
+                return None
+            if entry_hash == h:
+                record = self.record(entry - 1)
+                if self.name(record) == name:
+                    return self.node(entry - 1, record)
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self.nodes.clear()
+        self.mm.close()
+
+
+class JournalError(Exception):
+    """Журнал нельзя воспроизвести или открыть: продолжать работу с --persist
+    нельзя, иначе изменения молча перестанут сохраняться"""
+
+
+class Journal:
+    """Журнал изменений VFS: одна JSON-запись в строке с порядковым номером seq"""
+    def __init__(self, path, seq=0, fsync_every=1):
+        self.path = path
+        self.seq = seq # Номер последней записи
+        self.fsync_every = fsync_every # fsync каждые N записей (0 - без fsync)
+        self.pending = 0 # Записи после последнего fsync
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, record):
+        self.seq += 1
+        record["seq"] = self.seq
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.pending += 1
+        if self.fsync_every and self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        if self.pending:
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def truncate(self):
+        """Очистка журнала после записи снимка"""
+        self.file.close()
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.pending = 0
+
+    def close(self):
+        if self.fsync_every:
+            self.sync()
+        self.file.close()
+
+
+def read_journal(path):
+    """Чтение записей журнала. Оборванная последняя строка (сбой при записи)
+    отбрасывается. Возвращает (записи, размер корректной части файла)"""
+    records = []
+    valid_size = 0
+    if not os.path.exists(path):
+        return records, valid_size
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            valid_size += len(line)
+    return records, valid_size
+
+
+def write_image(root, image_path, read_content):
+    """Запись дерева VFS в бинарный образ"""
+    # Обход в ширину: (узел, номер родителя, имя, полный путь)
+    order = [(root, 0, "", "/")]
+    records = []
+    strings = bytearray()
+    blob = bytearray()
+    offsets = {} # содержимое -> смещение в блоке содержимого
+    i = 0
+    while i < len(order):
+        node, parent, name, path = order[i]
+        name_bytes = name.encode('utf-8')
+        name_off = len(strings)
+        strings += name_bytes
+        if node.is_dir:
+            first = len(order)
+            prefix = path if path.endswith('/') else path + '/'
+            for child_name, child in node.content.items():
+                order.append((child, i, child_name, prefix + child_name))
+            records.append((parent, name_off, len(name_bytes), IMAGE_DIR_FLAG | node.perms,
+                            0, first, len(order) - first))
+        else:
+            data = read_content(node).encode('utf-8')
+            # Одинаковое содержимое записывается в блок один раз
+            data_off = offsets.get(data)
+            if data_off is None:
+                data_off = offsets[data] = len(blob)
+                blob += data
+            records.append((parent, name_off, len(name_bytes), node.perms,
+                            node.size, data_off, len(data)))
+        i += 1
+
+    # Хеш-таблица с открытой адресацией, заполнена не более чем наполовину
+    capacity = 1
+    while capacity < len(order) * 2:
+        capacity *= 2
+    index = bytearray(capacity * IMAGE_INDEX_ENTRY.size)
+    mask = capacity - 1
+    for number, (_, _, _, path) in enumerate(order):
+        h = path_hash(path)
+        slot = h & mask
+        while IMAGE_INDEX_ENTRY.unpack_from(index, slot * IMAGE_INDEX_ENTRY.size)[1]:
+            slot = (slot + 1) & mask
+        IMAGE_INDEX_ENTRY.pack_into(index, slot * IMAGE_INDEX_ENTRY.size, h, number + 1)
+
+    nodes_off = IMAGE_HEADER.size
+    strings_off = nodes_off + len(records) * IMAGE_NODE.size
+    blob_off = strings_off + len(strings)
+    index_off = blob_off + len(blob)
+    with open(image_path, 'wb') as f:
+        f.write(IMAGE_HEADER.pack(IMAGE_MAGIC, 1, len(records), nodes_off, strings_off, len(strings),
+                                  blob_off, len(blob), index_off, capacity))
+        for record in records:
+            f.write(IMAGE_NODE.pack(*record))
+        f.write(strings)
+        f.write(blob)
+        f.write(index)
+    return len(records)
+
+
+class VFSApp: # Запуск в терминале: python3 emulator.py
+    node_class = VFSNode # Класс узлов VFS (можно заменить на другую реализацию)
+
+    def __init__(self, vfs_path='./vfs_root', script_path=None, vfs_csv=None,
+                 lazy_content=False, content_cache_size=64 * 1024 * 1024, memory_report=False,
+                 vfs_image=None, path_cache_size=4096, path_index=False, script_cache=None,
+                 output=None, quiet=False, load_workers=1, profile=None,
+                 persist=False, snapshot_every=10000, fsync_every=1,
+                 line_index_size=16 * 1024 * 1024, listing_cache_size=256 * 1024 * 1024,
+                 transactional=False, export_path=None, export_diff=False):
+
+        self.output = output if output is not None else OutputSink() # Приемник вывода
+        self.quiet = quiet # Без приветствия и эха команд скрипта
+        self.profile_path = profile # Файл для JSON-отчета профилирования
+        self.profiler = Profiler() if profile else None # None - профилирование выключено
+        self.last_code = EXIT_OK # Код завершения последней команды
+        self.exit_requested = False # Последней была команда exit
+        self.interrupted = False # Команда прервана Ctrl+C (скрипт останавливается)
+        self.stdin = None # Строки вывода предыдущей команды конвейера
+        self.error_output = None # Приемник сообщений об ошибках (None - тот же, что output)
         self.vfs_path = vfs_path # Путь к физическому расположению VFS
         self.script_path = script_path # Путь к скрипту для выполнения
         self.vfs_csv = vfs_csv # Путь к CSV файлу с данными VFS
-        self.current_vfs = {}  # Текущая структура VFS в памяти
+        self.lazy_content = lazy_content # Декодировать содержимое файлов при первом обращении
+        self.content_cache = ContentCache(content_cache_size) # Кэш декодированного содержимого
+        self.blobs = BlobStore() # Содержимое файлов по хешу со счетчиками ссылок
+        # Индексы строк файлов для чтения диапазонов (0 - без индексов)
+        self.line_indexes = ContentCache(line_index_size, lambda starts: starts.itemsize * len(starts))
+        # Отсортированные списки имен директорий: (директория, порядок) -> список
+        self.listings = ContentCache(listing_cache_size, listing_size)
+        self._csv_handle = None # Открытый CSV файл для ленивого чтения
+        self._csv_fieldnames = None # Заголовки CSV для ленивого чтения
+        self.load_workers = load_workers # Число процессов для разбора CSV
+        self.vfs_image = vfs_image # Путь к бинарному образу VFS
+        self.image = None # Отображенный в память образ
+        self.image_removed = set() # Удаленные пути, которые нельзя искать в индексе образа
+        self.show_memory_report = memory_report # Вывести отчет о памяти при запуске
+        self.persist = persist # Сохранять изменения в vfs_path (журнал и снимки)
+        self.snapshot_every = snapshot_every # Записей журнала между снимками
+        self.fsync_every = fsync_every # fsync журнала каждые N записей
+        self.journal = None # Открытый журнал изменений
+        self.mutations = None # Список для сбора изменений сессии (None - не собираются)
+        self.transactional = transactional # Скрипт выполняется в транзакции с откатом при ошибке
+        self.undo_log = None # Журнал отмены открытой транзакции (None - транзакции нет)
+        self.pending_mutations = [] # Изменения транзакции, записываемые в журнал при commit
+        self.transaction_dir = "/" # Текущая директория на момент begin
+        self.changed_paths = set() # Пути, добавленные, замененные или удаленные после загрузки
+        self.transaction_paths = [] # Пути, впервые измененные в открытой транзакции
+        self.export_path = export_path # CSV для выгрузки дерева после скрипта
+        self.export_diff = export_diff # Выгружать только изменения после загрузки
+        self.snapshot_seq = 0 # Номер последней записи журнала, вошедшей в снимок
+        self.snapshot_path = None # Текущий снимок
+        self.path_cache = PathCache(path_cache_size) # Кэш разрешенных путей
+        self.build_path_index = path_index # Строить индекс всех путей при загрузке
+        self.path_index = None # Индекс полный путь -> узел
+        self.use_load_cursor = True # Искать родителя строки CSV от предков предыдущей строки
+        self.load_cursor = None # Цепочка (путь, директория) предыдущей строки CSV при загрузке
+        self.load_cursor_enabled = True # False - строки CSV не отсортированы, поиск от корня
+        self.load_cursor_rows = 0 # Строк, для которых родитель искался курсором
+        self.load_cursor_steps = 0 # Сколько раз при этом курсор поднимался на уровень вверх
+        self.current_vfs = None  # Корневой узел VFS в памяти
+        self.script_cache = script_cache # Директория для кэша скомпилированных скриптов
         self.current_dir = "/"  # Текущая рабочая директория
+        self.cwd_parts = [] # Компоненты пути текущей директории
+        self.cwd_nodes = None # Цепочка узлов от корня до текущей директории (None - не вычислена)
+
+        self.copy_on_write = False # Изменения копируют директории (режим сессии)
+        self.owned_nodes = set() # Директории, скопированные этой сессией
+        self.commands = self.create_command_table() # Таблица команд: имя -> обработчик
 
-        # Загружаем VFS из CSV или создаем стандартную
-        if not self.load_vfs_from_csv():
+        # Загружаем VFS из снимка, образа, CSV или создаем стандартную
+        if not self.load_snapshot() and not self.load_vfs_from_image() and not self.load_vfs_from_csv():
             self.initialize_default_vfs()
+        if self.persist:
+            # Изменения после снимка восстанавливаются из журнала
+            self.open_journal()
+        if self.build_path_index and self.image is None:
+            # У образа есть собственный хеш-индекс путей
+            timer = self.profiler.phase_timer() if self.profiler else None
+            self.path_index = self.create_path_index()
+            if timer:
+                timer.mark("path_index")
+
+    def create_command_table(self):
+        return {
+            "ls": self.list_directory,
+            "cd": self.change_directory,
+            "head": self.head_file,
+            "tail": self.tail_file,
+            "cat": self.cat_files,
+            "wc": self.word_count,
+            "sed": self.print_lines,
+            "date": self.show_date,
+            "cp": self.copy_file,
+            "rmdir": self.remove_directory,
+            "rm": self.remove_items,
+            "find": self.find_items,
+            "du": self.disk_usage,
+            "grep": self.grep_lines,
+            "export": self.export_tree,
+            "begin": self.begin_transaction,
+            "commit": self.commit_transaction,
+            "rollback": self.rollback_transaction,
+            "stats": self.show_stats,
+            PIPELINE: self.run_pipeline,
+        }
 
+    def fork_session(self, output=None):
+        """Новая сессия над тем же деревом: своя текущая директория, вывод и кэши.
+        Изменения сессии копируют затронутые директории и не видны другим сессиям"""
+        session = copy.copy(self)
+        session.output = output if output is not None else CaptureSink()
+        session.current_dir = "/"
+        session.cwd_parts = []
+        session.cwd_nodes = None
+        session.path_cache = PathCache(self.path_cache.max_entries)
+        session.image_removed = set(self.image_removed)
+        session.copy_on_write = True
+        session.owned_nodes = set()
+        session.last_code = EXIT_OK
+        session.exit_requested = False
+        session.commands = session.create_command_table()
+        # Сессия считает только собственные ссылки на общие блобы
+        session.blobs = BlobStore()
+        # Изменения сессий не сохраняются в общий журнал
+        session.journal = None
+        session.mutations = None
+        session.stdin = None
+        session.error_output = None
+        session.undo_log = None
+        session.pending_mutations = []
+        session.changed_paths = set(self.changed_paths)
+        session.transaction_paths = []
+        return session
+
+    def run(self):
+        """Запуск эмулятора: выполнение скрипта и интерактивный режим.
+        Возвращает код завершения процесса"""
         # Вывод информации о запуске
-        self.print_output(f"VFS Emulator started")
-        self.print_output(f"VFS path: {vfs_path}")
-        if vfs_csv:
-            self.print_output(f"VFS source: {vfs_csv}")
-
-        # Если указан скрипт - выполняем его
-        if script_path:
-            self.print_output(f"Script to execute: {script_path}")
-            script_completed = self.run_script()
-
-            if script_completed:
-                self.print_output("Script completed successfully")
-                # sys.exit(0)  # Завершаем программу после успешного скрипта
-            else:
-                self.print_output("Script execution failed")
-                sys.exit(1)  # Завершаем программу с ошибкой после неудачного скрипта
+        if not self.quiet:
+            self.print_output(f"VFS Emulator started")
+            self.print_output(f"VFS path: {self.vfs_path}")
+            if self.vfs_image:
+                self.print_output(f"VFS image: {self.vfs_image}")
+            elif self.vfs_csv:
+                self.print_output(f"VFS source: {self.vfs_csv}")
+        if self.show_memory_report:
+            self.memory_report()
+
+        try:
+            # Если указан скрипт - выполняем его
+            if self.script_path:
+                if not self.quiet:
+                    self.print_output(f"Script to execute: {self.script_path}")
+                script_completed = self.run_script()
+
+                if script_completed:
+                    if not self.quiet:
+                        self.print_output("Script completed successfully")
+                    # sys.exit(0)  # Завершаем программу после успешного скрипта
+                else:
+                    self.print_output("Script execution failed")
+                    return 1  # Завершаем программу с ошибкой после неудачного скрипта
+
+            if self.export_path and not self.export_tree(
+                    ["--diff", self.export_path] if self.export_diff else [self.export_path]):
+                return 1
+
+            # Всегда переходим в интерактивный режим
+            self.run_interactive()
+            return 0
+        finally:
+            self.write_profile()
+            self.close()
+            self.output.flush()
+
+    def find_snapshot(self):
+        """Последний снимок в vfs_path: (путь, номер записи журнала) или (None, 0)"""
+        best = (None, 0)
+        if not os.path.isdir(self.vfs_path):
+            return best
+        for name in os.listdir(self.vfs_path):
+            match = re.fullmatch(r'snapshot-(\d+)\.img', name)
+            if match and (best[0] is None or int(match.group(1)) > best[1]):
+                best = (os.path.join(self.vfs_path, name), int(match.group(1)))
+        return best
+
+    def load_snapshot(self):
+        """Загрузка последнего снимка вместо импорта CSV"""
+        if not self.persist:
+            return False
+        snapshot_path, seq = self.find_snapshot()
+        if snapshot_path is None:
+            return False
+        try:
+            self.image = VFSImage(snapshot_path, self.node_class)
+        except (OSError, ValueError, struct.error) as e:
+            self.print_error(f"Error loading snapshot {snapshot_path}: {e}")
+            return False
+        self.current_vfs = self.image.node(0)
+        self.snapshot_path = snapshot_path
+        self.snapshot_seq = seq
+        return True
 
-        # Всегда переходим в интерактивный режим
-        self.run_interactive()
+    def open_journal(self):
+        """Воспроизведение журнала после снимка и открытие его для записи"""
+        try:
+            os.makedirs(self.vfs_path, exist_ok=True)
+            journal_path = os.path.join(self.vfs_path, "journal.log")
+            records, valid_size = read_journal(journal_path)
+            if os.path.exists(journal_path) and os.path.getsize(journal_path) > valid_size:
+                # Отрезаем оборванную запись, чтобы новые записи начинались с новой строки
+                with open(journal_path, 'r+b') as f:
+                    f.truncate(valid_size)
+
+            timer = self.profiler.phase_timer() if self.profiler else None
+            seq = self.snapshot_seq
+            replayed = 0
+            for record in records:
+                if record.get("seq", 0) <= self.snapshot_seq:
+                    continue  # уже вошла в снимок
+                self.apply_journal_record(record)
+                seq = record["seq"]
+                replayed += 1
+            if timer:
+                timer.mark("journal_replay")
+
+            self.journal = Journal(journal_path, seq, self.fsync_every)
+            self.mutations_since_snapshot = replayed
+            if not self.quiet:
+                source = self.snapshot_path or "initial VFS"
+                self.print_output(f"VFS restored from {source} + {replayed} journal records")
+        except Exception as e:
+            raise JournalError(f"Error opening journal in {self.vfs_path}: {e}") from e
+
+    def apply_journal_record(self, record):
+        """Повторное применение изменения из журнала"""
+        op = record["op"]
+        path = record["path"]
+        parent_path, name = path.rsplit('/', 1)
+        parent_path = parent_path or "/"
+        parent = self.get_directory_by_path(parent_path)
+        if parent is None or not parent.is_dir:
+            raise ValueError(f"journal record {record.get('seq')}: {parent_path} is not a directory")
+        if op == "copy":
+            source = self.get_directory_by_path(record["source"])
+            if source is None:
+                raise ValueError(f"journal record {record.get('seq')}: {record['source']} not found")
+            self.copy_node(source, parent, parent_path, name)
+        elif op == "remove":
+            self.remove_node(parent, parent_path, name)
+        elif op == "write":
+            self.store_text(parent, parent_path, name, record["content"], record.get("append", False))
+        else:
+            raise ValueError(f"journal record {record.get('seq')}: unknown operation {op}")
+
+    def record_mutation(self, op, path, **fields):
+        """Запись изменения в журнал (если включено сохранение)"""
+        if self.undo_log is not None:
+            # Изменения транзакции записываются при commit
+            self.pending_mutations.append((op, path, fields))
+            return
+        if self.mutations is not None:
+            self.mutations.append(dict(fields, op=op, path=path))
+        if self.journal is None:
+            return
+        record = {"op": op, "path": path}
+        record.update(fields)
+        self.journal.append(record)
+        self.mutations_since_snapshot += 1
+        if self.snapshot_every and self.mutations_since_snapshot >= self.snapshot_every:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """Сжатие: текущее дерево записывается в снимок, журнал очищается"""
+        seq = self.journal.seq
+        snapshot_path = os.path.join(self.vfs_path, f"snapshot-{seq}.img")
+        tmp_path = snapshot_path + ".tmp"
+        write_image(self.current_vfs, tmp_path, self.read_file_content)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+        # Записи с номером не больше seq уже в снимке, даже если очистка журнала не успеет
+        self.journal.truncate()
+        self.mutations_since_snapshot = 0
+
+        self.snapshot_path = snapshot_path
+        self.snapshot_seq = seq
+        for name in os.listdir(self.vfs_path):
+            match = re.fullmatch(r'snapshot-(\d+)\.img', name)
+            if match and int(match.group(1)) < seq:
+                try:
+                    os.remove(os.path.join(self.vfs_path, name))
+                except OSError:
+                    pass  # файл еще отображен в память (Windows) - удалится при следующем снимке
+
+    def close(self):
+        """Сохранение журнала и освобождение файлов"""
+        if self.undo_log is not None:
+            # Незавершенная транзакция не сохраняется
+            self.rollback()
+            self.print_output("Uncommitted transaction rolled back")
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self._csv_handle is not None:
+            self._csv_handle.close()
+            self._csv_handle = None
+
+    def load_vfs_from_image(self):
+        """Подключение бинарного образа VFS (дерево читается по мере обращения)"""
+        if not self.vfs_image:
+            return False
+
+        try:
+            timer = self.profiler.phase_timer() if self.profiler else None
+            self.image = VFSImage(self.vfs_image, self.node_class)
+            self.current_vfs = self.image.node(0)
+            if timer:
+                timer.mark("image_map")
+            return True
+        except (OSError, ValueError, struct.error) as e:
+            self.print_error(f"Error loading VFS image: {e}")
+            self.image = None
+            return False
 
     def load_vfs_from_csv(self):
         """Загрузка VFS из CSV файла"""
@@ -48,437 +1182,1718 @@ class VFSApp: # Запуск в терминале: python3 emulator.py
             return False
 
         if not os.path.exists(self.vfs_csv):
-            self.print_output(f"Error: VFS CSV file '{self.vfs_csv}' not found")
+            self.print_error(f"Error: VFS CSV file '{self.vfs_csv}' not found")
             return False
 
         try:
             # Инициализируем корневую директорию
-            self.current_vfs = {"/": {"type": "directory", "content": {}, "perms": "755"}}
+            self.current_vfs = self.node_class.directory()
 
-            # Читаем CSV файл
-            with open(self.vfs_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-
-                # Обрабатываем каждую строку CSV
-                for row_num, row in enumerate(reader, 1):
-                    if not self.validate_csv_row(row, row_num):
-                        continue
-
-                    path = row['path'].strip()
-                    item_type = row['type'].strip()
-                    perms = row.get('perms', '644').strip()
-
-                    # Создаем структуру директорий
-                    self.create_path_structure(path, item_type, perms, row, row_num)
-
-            self.print_output(f"VFS loaded successfully from {self.vfs_csv}")
+            timer = self.profiler.phase_timer() if self.profiler else None
+            if self.lazy_content:
+                self.load_vfs_from_csv_lazy(timer)
+            elif self.load_workers > 1:
+                self.load_vfs_from_csv_parallel(timer)
+            else:
+                # Читаем CSV файл
+                with open(self.vfs_csv, 'r', encoding='utf-8') as f:
+                    reader = csv.DictReader(f)
+
+                    # Обрабатываем каждую строку CSV
+                    for row_num, row in enumerate(reader, 1):
+                        if timer:
+                            timer.mark("csv_parse")
+                        valid = self.validate_csv_row(row, row_num)
+                        if timer:
+                            timer.mark("validate")
+                        if not valid:
+                            continue
+
+                        path = row['path'].strip()
+                        item_type = row['type'].strip()
+                        perms = row.get('perms', '644').strip()
+                        size, content = 0, ""
+                        if item_type == 'file':
+                            size = int(row.get('size', 0))
+                            content = decode_content(row.get('content', ''))
+                            if timer:
+                                timer.mark("base64_decode")
+
+                        # Создаем структуру директорий
+                        self.create_path_structure(path, item_type, perms, size, content, row_num)
+                        if timer:
+                            timer.mark("create_path_structure")
+
+            if not self.quiet:
+                self.print_output(f"VFS loaded successfully from {self.vfs_csv}")
             return True
 
         except Exception as e:
-            self.print_output(f"Error loading VFS from CSV: {e}")
+            self.print_error(f"Error loading VFS from CSV: {e}")
             return False
 
-    def validate_csv_row(self, row, row_num):
-        required_fields = ['path', 'type']
-        for field in required_fields:
-            if field not in row or not row[field]:
-                self.print_output(f"Error in row {row_num}: missing required field '{field}'")
-                return False
+    def load_vfs_from_csv_lazy(self, timer=None):
+        """Потоковая загрузка CSV: для файлов запоминается только положение строки"""
+        with open(self.vfs_csv, 'rb') as f:
+            header = f.readline()
+            fieldnames = next(csv.reader([header.decode('utf-8')]), None)
+            if not fieldnames:
+                return
+            self._csv_fieldnames = fieldnames
+
+            row_num = 0
+            for offset, raw in self.iter_csv_records(f, len(header)):
+                values = next(csv.reader([raw.decode('utf-8')]), [])
+                if not values:
+                    # Пустые строки пропускаются, как в csv.DictReader
+                    continue
+                row_num += 1
+                row = self.row_from_values(values)
+                if timer:
+                    timer.mark("csv_scan")
+                valid = self.validate_csv_row(row, row_num)
+                if timer:
+                    timer.mark("validate")
+                if not valid:
+                    continue
+
+                path = row['path'].strip()
+                item_type = row['type'].strip()
+                perms = row.get('perms', '644').strip()
+
+                size, content = 0, ""
+                if item_type == 'file':
+                    # Вместо содержимого сохраняем ссылку на строку CSV
+                    size = int(row.get('size', 0))
+                    content = LazyContent(offset, len(raw))
+                self.create_path_structure(path, item_type, perms, size, content, row_num)
+                if timer:
+                    timer.mark("create_path_structure")
+
+    def load_vfs_from_csv_parallel(self, timer=None):
+        """Загрузка CSV несколькими процессами: файл делится на диапазоны по концам строк
+        (строки с переносами внутри полей в кавычках не поддерживаются)"""
+        with open(self.vfs_csv, 'rb') as f:
+            header = f.readline()
+            fieldnames = next(csv.reader([header.decode('utf-8')]), None)
+            if not fieldnames:
+                return
+            file_size = os.fstat(f.fileno()).st_size
+
+            # Границы диапазонов: ближайший конец строки после равномерной отметки
+            chunks = self.load_workers * 4
+            bounds = [len(header)]
+            for i in range(1, chunks):
+                f.seek(max(len(header) + (file_size - len(header)) * i // chunks - 1, bounds[-1]))
+                f.readline()
+                position = f.tell()
+                if position > bounds[-1] and position < file_size:
+                    bounds.append(position)
+            bounds.append(file_size)
+
+        with ProcessPoolExecutor(max_workers=self.load_workers) as pool:
+            futures = [pool.submit(parse_csv_chunk, self.vfs_csv, fieldnames, start, end)
+                       for start, end in zip(bounds, bounds[1:])]
+
+            # Слияние в исходном порядке строк, номера строк - сквозные
+            first_row = 0
+            for future in futures:
+                rows, entries = future.result()
+                if timer:
+                    timer.mark("workers")
+                for row_num, error, record in entries:
+                    if error:
+                        self.print_error(f"Error in row {first_row + row_num}: {error}")
+                    else:
+                        self.create_path_structure(*record, first_row + row_num)
+                first_row += rows
+                if timer:
+                    timer.mark("create_path_structure")
+
+    def iter_csv_records(self, f, offset):
+        """Генератор записей CSV вместе с их смещением в файле"""
+        record = b""
+        start = offset
+        for line in f:
+            if not record:
+                start = offset
+            offset += len(line)
+            record += line
+            # Запись продолжается, если кавычки не закрыты (перенос внутри поля)
+            if record.count(b'"') % 2:
+                continue
+            yield start, record
+            record = b""
+        if record:
+            yield start, record
+
+    def row_from_values(self, values):
+        return row_from_values(self._csv_fieldnames, values)
+
+    def read_file_content(self, item):
+        """Получение содержимого файла с декодированием ленивых ссылок"""
+        content = item.content
+        if isinstance(content, Blob):
+            return content.data
+        if isinstance(content, ImageContent):
+            return self.image.read(content)
+        if not isinstance(content, LazyContent):
+            return content
+
+        cached = self.content_cache.get(content.offset)
+        if cached is not None:
+            return cached
+
+        if self._csv_handle is None:
+            self._csv_handle = open(self.vfs_csv, 'rb')
+        self._csv_handle.seek(content.offset)
+        raw = self._csv_handle.read(content.length)
+        values = next(csv.reader([raw.decode('utf-8')]), [])
+        content_b64 = self.row_from_values(values).get('content') or ''
+        decoded = decode_content(content_b64)
+
+        self.content_cache.put(content.offset, decoded)
+        return decoded
+
+    def content_view(self, item):
+        """Построчный доступ к содержимому файла; содержимое образа читается
+        прямо из mmap без декодирования всего файла"""
+        content = item.content
+        if isinstance(content, ImageContent):
+            start = self.image.blob_off + content.offset
+            return ContentView(self.image.mm, start, start + content.length)
+        text = self.read_file_content(item)
+        return ContentView(text, 0, len(text))
+
+    def line_index(self, item, view):
+        """Индекс строк файла: строится при первом чтении и хранится в LRU-кэше.
+        Ключ - ссылка на содержимое, поэтому копии файла используют общий индекс,
+        а измененное содержимое получает новый"""
+        if not self.line_indexes.max_bytes:
+            return None
+        content = item.content
+        if isinstance(content, Blob):
+            key = content.digest
+        elif isinstance(content, ImageContent):
+            key = ("image", content.offset, content.length)
+        elif isinstance(content, LazyContent):
+            key = ("csv", content.offset)
+        else:
+            return None
+        starts = self.line_indexes.get(key)
+        if starts is None:
+            starts = view.line_starts()
+            self.line_indexes.put(key, starts)
+        return starts
 
-        if row['type'] not in ['file', 'directory']:
-            self.print_output(f"Error in row {row_num}: type must be 'file' or 'directory'")
+    def validate_csv_row(self, row, row_num):
+        error = csv_row_error(row)
+        if error:
+            self.print_error(f"Error in row {row_num}: {error}")
             return False
-
         return True
 
-    def create_path_structure(self, path, item_type, perms, row, row_num):
+    def create_path_structure(self, path, item_type, perms, size, content, row_num):
         """Создание структуры пути в VFS"""
         if path == "/":
             return
 
-        # Разбиваем путь на компоненты
-        parts = path.strip('/').split('/')
-        current = self.current_vfs["/"]
+        # Разбиваем путь на родительскую директорию и имя
+        stripped = path.strip('/')
+        slash = stripped.rfind('/')
+        parent_key = stripped[:slash] if slash >= 0 else ""
+        node_class = self.node_class
 
-        # Создаем промежуточные директории
-        for part in parts[:-1]:
-            if part not in current['content']:
-                current['content'][part] = {
-                    "type": "directory",
-                    "content": {},
-                    "perms": "755"
-                }
-            current = current['content'][part]
-            if current['type'] != 'directory':
-                self.print_output(f"Error in row {row_num}: '{part}' is not a directory")
-                return
+        current = self.load_parent(parent_key, row_num)
+        if current is None:
+            return
 
         # Создаем конечный элемент (файл или директорию)
-        filename = parts[-1]
+        filename = sys.intern(stripped[slash + 1:])
+        if item_type == 'removed':
+            # Строка выгрузки изменений (export --diff): путь удален
+            current.content.pop(filename, None)
+            return
+
+        default = 0o755 if item_type == 'directory' else 0o644
+        mode = parse_perms(perms, default)
+        if mode is None:
+            self.print_error(f"Warning in row {row_num}: invalid perms '{perms}', "
+                             f"using {format(default, 'o')}")
+            mode = default
         if item_type == 'directory':
-            current['content'][filename] = {
-                "type": "directory",
-                "content": {},
-                "perms": perms
-            }
-        else:  # file
-            size = int(row.get('size', 0))
-            content_b64 = row.get('content', '')
-            # Декодируем содержимое из base64
-            content = base64.b64decode(content_b64).decode('utf-8') if content_b64 else ""
-
-            current['content'][filename] = {
-                "type": "file",
-                "size": size,
-                "content": content,
-                "perms": perms
-            }
+            current.content[filename] = node_class.directory(perms=mode)
+        else:  # file (содержимое уже декодировано или LazyContent)
+            if isinstance(content, str):
+                # Одинаковое содержимое хранится один раз
+                content = self.blobs.put(content)
+            current.content[filename] = node_class.file(content, size, mode)
+
+    def load_parent(self, parent_key, row_num):
+        """Родительская директория строки CSV ('a/b' без крайних '/') с созданием
+        промежуточных директорий. Курсор - цепочка директорий предыдущей строки:
+        в отсортированном CSV соседние строки имеют общих предков, поэтому поиск
+        продолжается от общего префикса, а не от корня"""
+        cursor = self.load_cursor
+        if not cursor or cursor[0][1] is not self.current_vfs:
+            # Новая загрузка (корень заменен) - курсор строится заново
+            cursor = self.load_cursor = [("", self.current_vfs)]
+            self.load_cursor_enabled = self.use_load_cursor
+            self.load_cursor_rows = self.load_cursor_steps = 0
+
+        if self.load_cursor_enabled:
+            top_key, top = cursor[-1]
+            if top_key == parent_key:
+                return top  # родитель тот же, что у предыдущей строки
+            # Поднимаемся до ближайшего общего предка
+            depth = len(cursor)
+            while len(cursor) > 1 and not parent_key.startswith(cursor[-1][0] + '/'):
+                cursor.pop()
+            top_key, current = cursor[-1]
+            remaining = parent_key[len(top_key) + 1:] if top_key else parent_key
+
+            self.load_cursor_rows += 1
+            self.load_cursor_steps += depth - len(cursor)
+            if self.load_cursor_rows >= 1024 and self.load_cursor_steps > self.load_cursor_rows:
+                # Строки не отсортированы: курсор поднимается далеко почти для каждой строки,
+                # дальше родитель ищется от корня
+                self.load_cursor_enabled = False
+        else:
+            top_key, current = "", self.current_vfs
+            remaining = parent_key
+
+        if not remaining and top_key == parent_key:
+            return current
+
+        # Создаем промежуточные директории
+        key = top_key
+        for part in remaining.split('/'):
+            child = current.content.get(part)
+            if child is None:
+                child = self.node_class.directory()
+                current.content[sys.intern(part)] = child
+            current = child
+            if not current.is_dir:
+                self.print_error(f"Error in row {row_num}: '{part}' is not a directory")
+                return None
+            if self.load_cursor_enabled:
+                key = key + '/' + part if key else part
+                cursor.append((key, current))
+        return current
 
     def initialize_default_vfs(self):
         """Создание VFS по умолчанию со стандартной структурой"""
-        self.current_vfs = {
-            "/": {
-                "type": "directory",
-                "content": {
-                    "home": {
-                        "type": "directory",
-                        "content": {
-                            "user": {
-                                "type": "directory",
-                                "content": {
-                                    "documents": {
-                                        "type": "directory",
-                                        "content": {
-                                            "readme.txt": {
-                                                "type": "file",
-                                                "size": 1024,
-                                                "content": "Welcome to VFS\nLine 1\nLine 2\nLine 3\nLine 4\nLine 5\nLine 6\nLine 7\nLine 8\nLine 9\nLine 10",
-                                                "perms": "644"
-                                            },
-                                            "notes.txt": {
-                                                "type": "file",
-                                                "size": 512,
-                                                "content": "Important notes:\nNote 1\nNote 2\nNote 3\nNote 4\nNote 5",
-                                                "perms": "644"
-                                            }
-                                        },
-                                        "perms": "755"
-                                    },
-                                    "photos": {
-                                        "type": "directory",
-                                        "content": {
-                                            "vacation": {
-                                                "type": "directory",
-                                                "content": {},
-                                                "perms": "755"
-                                            }
-                                        },
-                                        "perms": "755"
-                                    },
-                                    "temp": {
-                                        "type": "directory",
-                                        "content": {},
-                                        "perms": "755"
-                                    }
-                                },
-                                "perms": "755"
-                            }
-                        },
-                        "perms": "755"
-                    },
-                    "etc": {
-                        "type": "directory",
-                        "content": {
-                            "config.txt": {
-                                "type": "file",
-                                "size": 512,
-                                "content": "key=value\nserver=localhost\nport=8080\ntimeout=30",
-                                "perms": "644"
-                            }
-                        },
-                        "perms": "755"
-                    },
-                    "var": {
-                        "type": "directory",
-                        "content": {
-                            "log": {
-                                "type": "directory",
-                                "content": {},
-                                "perms": "755"
-                            }
-                        },
-                        "perms": "755"
-                    },
-                    "readme.txt": {
-                        "type": "file",
-                        "size": 2048,
-                        "content": "VFS Emulator\nThis is a virtual file system\nYou can use commands like ls, cd, head, date, cp, rmdir",
-                        "perms": "644"
-                    }
-                },
-                "perms": "755"
-            }
-        }
+        d = self.node_class.directory
+
+        def f(content, size):
+            return self.node_class.file(self.blobs.put(content), size)
+
+        self.current_vfs = d({
+            "home": d({
+                "user": d({
+                    "documents": d({
+                        "readme.txt": f("Welcome to VFS\nLine 1\nLine 2\nLine 3\nLine 4\nLine 5\nLine 6\nLine 7\nLine 8\nLine 9\nLine 10", 1024),
+                        "notes.txt": f("Important notes:\nNote 1\nNote 2\nNote 3\nNote 4\nNote 5", 512),
+                    }),
+                    "photos": d({
+                        "vacation": d(),
+                    }),
+                    "temp": d(),
+                }),
+            }),
+            "etc": d({
+                "config.txt": f("key=value\nserver=localhost\nport=8080\ntimeout=30", 512),
+            }),
+            "var": d({
+                "log": d(),
+            }),
+            "readme.txt": f("VFS Emulator\nThis is a virtual file system\nYou can use commands like ls, cd, head, date, cp, rmdir", 2048),
+        })
+
+    def create_path_index(self):
+        """Построение индекса полный путь -> узел для всего дерева"""
+        index = {}
+        stack = [("", self.current_vfs)]
+        while stack:
+            path, node = stack.pop()
+            for name, child in node.content.items():
+                full_path = path + '/' + name
+                index[full_path] = child
+                if child.is_dir:
+                    stack.append((full_path, child))
+        return index
+
+    def clone_directory(self, node):
+        clone = self.node_class.directory(dict(node.content), node.perms)
+        self.owned_nodes.add(clone)
+        return clone
+
+    def own_directory(self, path):
+        """Директория path, принадлежащая сессии: общие директории на пути от корня
+        заменяются копиями (copy-on-write)"""
+        node = self.current_vfs
+        if node not in self.owned_nodes:
+            node = self.current_vfs = self.clone_directory(node)
+            # Общий индекс путей указывает на узлы исходного дерева
+            self.path_index = None
+            self.cwd_nodes = None
+
+        current_path = ""
+        for part in path.split('/'):
+            if not part:
+                continue
+            current_path += '/' + part
+            child = node.content[part]
+            if child not in self.owned_nodes:
+                child = node.content[part] = self.clone_directory(child)
+                self.path_cache.invalidate(current_path)
+                self.cwd_nodes = None
+            node = child
+        return node
+
+    def insert_node(self, parent, parent_path, name, node):
+        """Добавление узла в директорию с обновлением индексов"""
+        if self.copy_on_write:
+            parent = self.own_directory(parent_path)
+        name = sys.intern(name)
+        old = parent.content.get(name)
+        parent.content[name] = node
+        self.update_listings(parent, name, old, node)
+        if old is not None and old.is_dir:
+            self.forget_listings(old)
+        path = child_path(parent_path, name)
+        if self.undo_log is not None:
+            self.undo_log.append((parent_path, name, old, True))
+        self.mark_changed(path)
+        if old is not None:
+            # Замена существующего узла (перезапись файла): индекс образа указывает на старый
+            self.path_cache.invalidate(path, old.is_dir)
+            if self.image is not None:
+                self.image_removed.add(path)
+            if old.is_dir and (self.current_dir == path or self.current_dir.startswith(path + '/')):
+                # Сохраненная цепочка узлов текущей директории устарела
+                self.cwd_nodes = None
+            if self.undo_log is None:
+                # В транзакции ссылки освобождаются при commit
+                self.release_node(old)
+        if self.path_index is not None:
+            self.path_index[path] = node
+            if node.is_dir:
+                for sub_path, sub_node in self.iter_subtree(path, node):
+                    self.path_index[sub_path] = sub_node
+
+    def sorted_listing(self, directory, order):
+        """Имена директории, отсортированные по имени или по размеру (сначала большие).
+        Список строится при первом запросе и дальше поддерживается при изменениях"""
+        listing = self.listings.get((directory, order))
+        if listing is None:
+            if order == "name":
+                listing = sorted(directory.content)
+            else:
+                listing = sorted((-child.size, name) for name, child in directory.content.items())
+            self.listings.put((directory, order), listing)
+        return listing
+
+    def update_listings(self, parent, name, old, new):
+        """Обновление отсортированных списков директории: old заменен на new
+        (None - элемента не было или он удален)"""
+        entries = self.listings.entries
+        by_name = entries.get((parent, "name"))
+        if by_name is not None and (old is None) != (new is None):
+            if new is None:
+                del by_name[bisect.bisect_left(by_name, name)]
+                self.listings.resize(-8)
+            else:
+                bisect.insort(by_name, name)
+                self.listings.resize(8)
+        by_size = entries.get((parent, "size"))
+        if by_size is not None:
+            delta = 0
+            if old is not None:
+                del by_size[bisect.bisect_left(by_size, (-old.size, name))]
+                delta -= 96
+            if new is not None:
+                bisect.insort(by_size, (-new.size, name))
+                delta += 96
+            self.listings.resize(delta)
+
+    def forget_listings(self, directory):
+        """Удаление из кэша списков удаленной директории и ее поддиректорий"""
+        if not self.listings.entries:
+            return
+        self.listings.discard((directory, "name"))
+        self.listings.discard((directory, "size"))
+        for _, child in self.iter_subtree("", directory):
+            if child.is_dir:
+                self.listings.discard((child, "name"))
+                self.listings.discard((child, "size"))
+
+    def duplicate_node(self, node):
+        """Новый узел с теми же метаданными: файл ссылается на то же содержимое,
+        директория создается пустой"""
+        if node.is_dir:
+            return self.node_class.directory(perms=node.perms)
+        if isinstance(node.content, Blob):
+            self.blobs.acquire(node.content)
+        return self.node_class.file(node.content, node.size, node.perms)
+
+    def copy_node(self, source, parent, parent_path, name):
+        """Копия source с именем name в директории parent. Содержимое файлов
+        не копируется; директория копируется со всем поддеревом.
+        Возвращает число скопированных узлов"""
+        copy = self.duplicate_node(source)
+        count = 1
+        if source.is_dir:
+            # Поддерево копируется целиком до вставки, поэтому копирование
+            # директории внутрь нее самой не зацикливается
+            stack = [(source, copy)]
+            try:
+                while stack:
+                    source_dir, copy_dir = stack.pop()
+                    for child_name, child in source_dir.content.items():
+                        child_copy = copy_dir.content[child_name] = self.duplicate_node(child)
+                        count += 1
+                        if child.is_dir:
+                            stack.append((child, child_copy))
+            except KeyboardInterrupt:
+                # Прерванная копия не вставлена в дерево - возвращаем ссылки на содержимое
+                self.release_node(copy)
+                raise
+        self.insert_node(parent, parent_path, name, copy)
+        return count
+
+    def release_node(self, node):
+        """Освобождение ссылок на содержимое удаленного файла или поддерева"""
+        if not node.is_dir:
+            if isinstance(node.content, Blob):
+                self.blobs.release(node.content)
+            return
+        for _, child in self.iter_subtree("", node):
+            if not child.is_dir and isinstance(child.content, Blob):
+                self.blobs.release(child.content)
+
+    def remove_node(self, parent, parent_path, name):
+        """Удаление узла из директории с точной инвалидацией кэшей"""
+        if self.copy_on_write:
+            parent = self.own_directory(parent_path)
+        node = parent.content.pop(name)
+        self.update_listings(parent, name, node, None)
+        if node.is_dir:
+            self.forget_listings(node)
+        path = child_path(parent_path, name)
+        self.mark_changed(path)
+        # Вложенные пути есть в кэше только у непустых директорий
+        recursive = node.is_dir and bool(node.content)
+        self.path_cache.invalidate(path, recursive)
+        if self.path_index is not None:
+            self.path_index.pop(path, None)
+            if recursive:
+                for sub_path, _ in self.iter_subtree(path, node):
+                    self.path_index.pop(sub_path, None)
+        if self.image is not None:
+            self.image_removed.add(path)
+        if self.current_dir == path or self.current_dir.startswith(path + '/'):
+            # Сохраненная цепочка узлов текущей директории устарела
+            self.cwd_nodes = None
+        if self.undo_log is not None:
+            self.undo_log.append((parent_path, name, node, False))
+        else:
+            self.release_node(node)
+        return node
+
+    def mark_changed(self, path):
+        """Отметка пути для export --diff"""
+        if path not in self.changed_paths:
+            self.changed_paths.add(path)
+            if self.undo_log is not None:
+                self.transaction_paths.append(path)
+
+    def begin(self):
+        """Начало транзакции: изменения записываются в журнал отмены"""
+        self.undo_log = []
+        self.pending_mutations = []
+        self.transaction_paths = []
+        self.transaction_dir = self.current_dir
+
+    def commit(self):
+        """Фиксация транзакции. Возвращает число изменений"""
+        undo_log, pending = self.undo_log, self.pending_mutations
+        self.undo_log = None
+        self.pending_mutations = []
+        self.transaction_paths = []
+        # Замененные и удаленные узлы больше не понадобятся для отката
+        for _, _, node, _ in undo_log:
+            if node is not None:
+                self.release_node(node)
+        for op, path, fields in pending:
+            self.record_mutation(op, path, **fields)
+        return len(undo_log)
+
+    def rollback(self):
+        """Откат транзакции в обратном порядке: стоимость пропорциональна числу
+        изменений, а не размеру дерева. Возвращает число отмененных изменений"""
+        undo_log = self.undo_log
+        self.undo_log = None
+        self.pending_mutations = []
+        for parent_path, name, node, inserted in reversed(undo_log):
+            parent = self.get_directory_by_path(parent_path)
+            if inserted and node is None:
+                # Отмена добавления освобождает ссылки добавленного узла
+                self.remove_node(parent, parent_path, name)
+            else:
+                # Возвращается замененный или удаленный узел, новый узел освобождается
+                self.insert_node(parent, parent_path, name, node)
+        # Пути, впервые измененные в транзакции, снова не отличаются от загруженных
+        self.changed_paths.difference_update(self.transaction_paths)
+        self.transaction_paths = []
+        if self.get_directory_by_path(self.current_dir) is None:
+            self.change_directory([self.transaction_dir])
+        return len(undo_log)
+
+    def iter_subtree(self, path, node):
+        """Генератор (путь, узел) для всех элементов внутри директории"""
+        stack = [(path, node)]
+        while stack:
+            dir_path, dir_node = stack.pop()
+            for name, child in dir_node.content.items():
+                full_path = child_path(dir_path, name)
+                yield full_path, child
+                if child.is_dir:
+                    stack.append((full_path, child))
+
+    def walk_tree(self, path, node, max_depth=None):
+        """Генератор (путь, узел, глубина) обхода в прямом порядке начиная с самого
+        узла; дочерние элементы идут в порядке директории, стек вместо рекурсии"""
+        stack = [(path, node, 0)]
+        while stack:
+            item_path, item, depth = stack.pop()
+            yield item_path, item, depth
+            if item.is_dir and (max_depth is None or depth < max_depth):
+                prefix = item_path.rstrip('/') + '/'
+                stack.extend((prefix + name, child, depth + 1)
+                             for name, child in reversed(item.content.items()))
+
+    def stream_output(self, lines):
+        """Вывод строк генератора по мере обхода (в конвейере - следующей команде)"""
+        self.output.write_stream(lines)
+
+    def memory_report(self):
+        """Оценка памяти на узел: старый формат словарей против VFSNode"""
+        nodes = 0
+        legacy_bytes = 0
+        node_bytes = 0
+        stack = [self.current_vfs]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            legacy = node.to_legacy_dict()
+            legacy_bytes += sys.getsizeof(legacy) + sys.getsizeof(legacy["perms"])
+            node_bytes += sys.getsizeof(node)
+            if node.is_dir:
+                # Словарь дочерних элементов есть в обоих форматах
+                legacy_bytes += sys.getsizeof(legacy["content"])
+                node_bytes += sys.getsizeof(node.content)
+                stack.extend(node.content.values())
+            else:
+                legacy_bytes += sys.getsizeof(legacy["size"])
+
+        self.print_output(f"Memory report: {nodes} nodes")
+        self.print_output(f"  dict nodes: {legacy_bytes} bytes ({legacy_bytes / nodes:.1f} bytes/node)")
+        self.print_output(f"  VFSNode:    {node_bytes} bytes ({node_bytes / nodes:.1f} bytes/node)")
 
     def print_output(self, text):
-        print(text)
+        self.output.write(text)
+
+    def print_error(self, text):
+        """Сообщение об ошибке: в конвейере идет в основной вывод, а не следующей команде"""
+        (self.error_output or self.output).write(text)
+
+    def execute(self, command_line):
+        """Выполнение одной команды для встраивания: вывод собирается в CommandResult"""
+        previous = self.output
+        sink = CaptureSink()
+        self.output = sink
+        try:
+            self.execute_command(command_line)
+        finally:
+            self.output = previous
+        return CommandResult(self.last_code, sink.lines, self.exit_requested)
 
     def execute_command(self, command_line, is_script=False):
+        self.last_code = EXIT_OK
+        self.exit_requested = False
+        self.interrupted = False
         command_line = command_line.strip()
         if not command_line:
             return True
 
         try:
+            if '|' in command_line or '>' in command_line:
+                pipeline = self.split_pipeline(command_line)
+                if pipeline is not None:
+                    return self.dispatch_command(PIPELINE, pipeline, is_script)
             # Парсим команду на части
             tokens = self.parse_command(command_line)
-            if not tokens:
-                return True
+        except ValueError as e:
+            self.print_error(f"Syntax error: {e}")
+            self.last_code = EXIT_SYNTAX
+            return False
+        if not tokens:
+            return True
 
-            command = tokens[0]
-            args = tokens[1:] if len(tokens) > 1 else []
+        return self.dispatch_command(tokens[0], tokens[1:], is_script)
 
-            # Обрабатываем команды
+    def dispatch_command(self, command, args, is_script=False):
+        """Выполнение разобранной команды через таблицу обработчиков"""
+        try:
             if command == "exit":
+                self.last_code = EXIT_OK
+                self.exit_requested = True
                 return False
-            elif command == "ls":
-                success = self.list_directory(args)
-            elif command == "cd":
-                success = self.change_directory(args)
-            elif command == "head":
-                success = self.head_file(args)
-            elif command == "date":
-                success = self.show_date(args)
-            elif command == "cp":
-                success = self.copy_file(args)
-            elif command == "rmdir":
-                success = self.remove_directory(args)
-            else:
-                self.print_output(f"Unknown command: {command}")
+
+            handler = self.commands.get(command)
+            if handler is None:
+                self.print_error(f"Unknown command: {command}")
+                self.last_code = EXIT_UNKNOWN
                 # выход при неизвестной команде
                 return is_script
 
-            # В режиме скрипта возвращаем False при ошибке для остановки
-            # if is_script:
-            #     return success
-            # else:
-            #     return True
+            if any(type(arg) is GlobPattern for arg in args):
+                args = self.expand_args(args)
+
+            # Результат команды не останавливает выполнение (ошибка уже выведена)
+            if self.profiler is None:
+                success = handler(args)
+            else:
+                start = time.perf_counter()
+                success = handler(args)
+                self.profiler.record_command(command, time.perf_counter() - start)
+            self.last_code = EXIT_OK if success else EXIT_FAILURE
             return True
 
+        except KeyboardInterrupt:
+            # Ctrl+C вне обхода дерева в обработчике (раскрытие шаблонов, rmdir):
+            # команда прерывается, как и обход, а оболочка продолжает работу
+            self.print_error(f"{'pipeline' if command == PIPELINE else command}: interrupted")
+            self.interrupted = True
+            self.last_code = EXIT_FAILURE
+            return True
         except ValueError as e:
-            self.print_output(f"Syntax error: {e}")
+            self.print_error(f"Syntax error: {e}")
+            self.last_code = EXIT_SYNTAX
+            return False
+        except Exception as e:
+            self.print_error(f"Command execution error: {e}")
+            self.last_code = EXIT_FAILURE
+            return False
+
+    def split_pipeline(self, command_line):
+        """Разбор строки с | и >/>>: [[(команда, аргументы), ...], перенаправление],
+        где перенаправление - None или (">" или ">>", путь). None - операторов
+        вне кавычек нет"""
+        quoted = [match.span() for match in QUOTED_PATTERN.finditer(command_line)]
+        segments = []
+        operators = []
+        start = 0
+        for match in PIPE_OPERATOR.finditer(command_line):
+            position = match.start()
+            if any(begin <= position < end for begin, end in quoted):
+                continue
+            if match.group() == "||":
+                raise ValueError("Operator || is not supported")
+            segments.append(command_line[start:position])
+            operators.append(match.group())
+            start = match.end()
+        if not operators:
+            return None
+        segments.append(command_line[start:])
+
+        redirect = None
+        if operators[-1] != "|":
+            tokens = self.parse_command(segments.pop())
+            if len(tokens) != 1:
+                raise ValueError("Redirection requires a single file path")
+            redirect = (operators.pop(), str(tokens[0]))
+        if any(operator != "|" for operator in operators):
+            raise ValueError("Redirection must be at the end of the command")
+
+        stages = []
+        for segment in segments:
+            tokens = self.parse_command(segment)
+            if not tokens:
+                raise ValueError("Empty command in pipeline")
+            stages.append((tokens[0], tokens[1:]))
+        return [stages, redirect]
+
+    def run_pipeline(self, pipeline):
+        """Выполнение конвейера: вывод каждой команды читается следующей лениво,
+        поэтому head в конце останавливает обход дерева в начале конвейера"""
+        stages, redirect = pipeline
+        for command, _ in stages:
+            # Конвейер с неизвестной командой не запускается целиком
+            if command not in self.commands or command == PIPELINE:
+                self.print_error(f"Unknown command: {command}")
+                return False
+        output, stdin, error_output = self.output, self.stdin, self.error_output
+        # Ошибки команд не попадают в данные конвейера и в файл перенаправления
+        self.error_output = error_output or output
+        sink = None
+        try:
+            for index, (command, args) in enumerate(stages):
+                self.stdin = sink.lines() if sink is not None else None
+                sink = PipeSink() if index < len(stages) - 1 or redirect else output
+                self.output = sink
+                if not self.dispatch_command(command, args):
+                    return False
+            success = self.last_code == EXIT_OK
+        finally:
+            self.output, self.stdin, self.error_output = output, stdin, error_output
+
+        if redirect is None:
+            return success
+        mode, path = redirect
+        try:
+            # Весь вывод вычисляется здесь и собирается в содержимое одним join
+            lines = list(sink.lines())
+        except KeyboardInterrupt:
+            self.print_error("interrupted, nothing written")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"Pipeline error: {e}")
             return False
+        return self.write_file(path, lines, append=mode == ">>") and success
+
+    def write_file(self, path, lines, append=False):
+        """Запись строк в файл VFS (> и >>)"""
+        try:
+            parent_path, parent, name = self.resolve_parent(path)
+            file_path = child_path(parent_path, name or "")
+            if name is None:
+                self.print_error(f"Error: {file_path} is not a file path")
+                return False
+            if not parent or not parent.is_dir:
+                self.print_error(f"Error: directory {parent_path} not found")
+                return False
+            existing = parent.content.get(name)
+            if existing is not None and existing.is_dir:
+                self.print_error(f"Error: {file_path} is a directory")
+                return False
+            if append and not lines:
+                return True
+
+            text = "\n".join(lines)
+            self.store_text(parent, parent_path, name, text, append)
+            self.record_mutation("write", file_path, content=text, append=append)
+            return True
+
         except Exception as e:
-            self.print_output(f"Command execution error: {e}")
+            self.print_error(f"write error: {e}")
             return False
 
+    def store_text(self, parent, parent_path, name, text, append):
+        """Создание или замена (append - дополнение) файла с текстом"""
+        existing = parent.content.get(name)
+        perms = 0o644
+        if existing is not None:
+            perms = existing.perms
+            if append:
+                old = self.read_file_content(existing)
+                text = old + "\n" + text if old else text
+        # Для ASCII размер равен длине строки, без кодирования копии содержимого
+        size = len(text) if text.isascii() else len(text.encode('utf-8'))
+        self.insert_node(parent, parent_path, name, self.node_class.file(self.blobs.put(text), size, perms))
+
+    def expand_args(self, args):
+        """Раскрытие шаблонов в аргументах; шаблон без совпадений остается как есть"""
+        expanded = []
+        for arg in args:
+            if type(arg) is GlobPattern:
+                matches = self.expand_glob(arg.pattern)
+                if matches:
+                    expanded.extend(matches)
+                    continue
+                arg = str(arg)
+            expanded.append(arg)
+        return expanded
+
+    def expand_glob(self, pattern):
+        """Пути, совпадающие с шаблоном (*, ?, [...], ** - любое число директорий),
+        в порядке сортировки. Относительный шаблон дает относительные пути"""
+        absolute = pattern.startswith('/')
+        only_dirs = pattern.endswith('/')
+        # Совпадения: (абсолютный путь, узел, путь для вывода)
+        if absolute:
+            matches = [("/", self.current_vfs, "/")]
+        else:
+            nodes = self.current_nodes()
+            if nodes is None:
+                return []  # текущая директория удалена - шаблон остается как есть
+            matches = [(self.current_dir, nodes[-1], "")]
+
+        for part in pattern.split('/'):
+            if not part or part == '.':
+                continue
+            next_matches = []
+            for path, node, shown in matches:
+                if not node.is_dir:
+                    continue
+                prefix = path.rstrip('/') + '/'
+                shown_prefix = shown + '/' if shown and not shown.endswith('/') else shown
+                if part == '..':
+                    parent_path = path.rsplit('/', 1)[0] or "/"
+                    parent = self.get_directory_by_path(parent_path)
+                    if parent is not None:
+                        next_matches.append((parent_path, parent, shown_prefix + '..'))
+                elif part == '**':
+                    # Сама директория и все вложенные директории
+                    for sub_path, sub_node, _ in self.walk_tree(path, node):
+                        if sub_node.is_dir:
+                            relative = sub_path[len(prefix):] if sub_path != path else ""
+                            next_matches.append((sub_path, sub_node,
+                                                 shown_prefix + relative if relative else shown))
+                elif not GLOB_CHARS.search(part):
+                    child = node.content.get(part)
+                    if child is not None:
+                        next_matches.append((prefix + part, child, shown_prefix + part))
+                else:
+                    for name in self.match_names(node, part):
+                        next_matches.append((prefix + name, node.content[name], shown_prefix + name))
+            matches = next_matches
+            if not matches:
+                return []
+
+        # ** и .. могут дать один путь несколько раз
+        results = {shown or ".": None for path, node, shown in matches
+                   if node.is_dir or not only_dirs}
+        return sorted(results)
+
+    def match_names(self, directory, pattern):
+        """Имена директории, совпадающие с шаблоном, по порядку. Проверяются только
+        имена с буквальным префиксом шаблона: диапазон в отсортированном списке имен"""
+        prefix = GLOB_CHARS.split(pattern, 1)[0]
+        match = re.compile(fnmatch.translate(pattern)).match
+        names = self.sorted_listing(directory, "name")
+        for i in range(bisect.bisect_left(names, prefix) if prefix else 0, len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            if match(name):
+                yield name
+
     def parse_command(self, command_line):
+        if '*' in command_line or '?' in command_line or '[' in command_line:
+            return self.parse_glob_command(command_line)
 
+        # Без кавычек токены - это части строки между пробелами
+        if '"' not in command_line and "'" not in command_line:
+            return [token for token in command_line.split(' ') if token]
+
+        parts = QUOTED_PATTERN.split(command_line)
         tokens = []
         current_token = ""
-        in_quotes = False # в кавычках
-        quote_char = None # тип кавычек
-
-        for char in command_line:
-            if char in ['"', "'"]:
-                if not in_quotes:
-                    in_quotes = True
-                    quote_char = char
-                elif char == quote_char:
-                    in_quotes = False
-                    quote_char = None
-                else:
-                    current_token += char
-            elif char == ' ' and not in_quotes:
+        for i in range(0, len(parts), 3):
+            plain = parts[i]
+            # Кавычка вне пар "..." / '...' осталась незакрытой
+            if '"' in plain or "'" in plain:
+                raise ValueError("Unclosed quotes in command")
+            if ' ' in plain:
+                pieces = plain.split(' ')
+                current_token += pieces[0]
                 if current_token:
                     tokens.append(current_token)
-                    current_token = ""
+                tokens.extend(piece for piece in pieces[1:-1] if piece)
+                current_token = pieces[-1]
             else:
-                current_token += char
+                current_token += plain
+            if i + 1 < len(parts):
+                # Содержимое кавычек продолжает текущий токен
+                current_token += parts[i + 1] or parts[i + 2] or ""
 
         if current_token:
             tokens.append(current_token)
 
-        if in_quotes:
-            raise ValueError("Unclosed quotes in command")
+        return tokens
+
+    def parse_glob_command(self, command_line):
+        """Разбор строки с символами шаблонов: такие токены вне кавычек
+        становятся GlobPattern и раскрываются при выполнении"""
+        if '"' not in command_line and "'" not in command_line:
+            return [GlobPattern(token, token) if GLOB_CHARS.search(token) else token
+                    for token in command_line.split(' ') if token]
 
+        parts = QUOTED_PATTERN.split(command_line)
+        tokens = []
+        current_token = ""
+        current_pattern = "" # Токен с экранированными символами шаблона из кавычек
+        magic = False # В токене есть символы шаблона вне кавычек
+
+        def finish():
+            if current_token:
+                tokens.append(GlobPattern(current_token, current_pattern) if magic else current_token)
+
+        for i in range(0, len(parts), 3):
+            plain = parts[i]
+            # Кавычка вне пар "..." / '...' осталась незакрытой
+            if '"' in plain or "'" in plain:
+                raise ValueError("Unclosed quotes in command")
+            if ' ' in plain:
+                pieces = plain.split(' ')
+                current_token += pieces[0]
+                current_pattern += pieces[0]
+                magic = magic or bool(GLOB_CHARS.search(pieces[0]))
+                finish()
+                for piece in pieces[1:-1]:
+                    if piece:
+                        tokens.append(GlobPattern(piece, piece) if GLOB_CHARS.search(piece) else piece)
+                current_token = current_pattern = pieces[-1]
+                magic = bool(GLOB_CHARS.search(current_token))
+            else:
+                current_token += plain
+                current_pattern += plain
+                magic = magic or bool(GLOB_CHARS.search(plain))
+            if i + 1 < len(parts):
+                # Содержимое кавычек продолжает текущий токен
+                quoted = parts[i + 1] or parts[i + 2] or ""
+                current_token += quoted
+                current_pattern += glob_escape(quoted)
+
+        finish()
         return tokens
 
-    def run_script(self):
-        # Выполнение скрипта из файла
-        if not self.script_path or not os.path.exists(self.script_path):
-            self.print_output(f"Error: Script {self.script_path} not found")
+    def compile_script(self, source):
+        """Разбор всего скрипта заранее: (список операций, список синтаксических ошибок).
+        Операция - (номер строки, строка, команда, аргументы)"""
+        ops = []
+        errors = []
+        for line_num, line in enumerate(source.split('\n'), 1): # нумерация строк с 1
+            line = line.strip() # удаление лишних пробелов
+            # Пропускаем пустые строки и комментарии
+            if not line or line.startswith('#'):
+                continue
+            try:
+                pipeline = self.split_pipeline(line) if '|' in line or '>' in line else None
+                if pipeline is not None:
+                    ops.append((line_num, line, PIPELINE, pipeline))
+                    continue
+                tokens = self.parse_command(line)
+            except ValueError as e:
+                errors.append(f"Syntax error at line {line_num}: {e}")
+                continue
+            if tokens:
+                ops.append((line_num, line, tokens[0], tokens[1:]))
+            else:
+                ops.append((line_num, line, None, []))
+        return ops, errors
+
+    def load_compiled_script(self, data):
+        """Скомпилированный скрипт из кэша по хешу содержимого или новая компиляция"""
+        key = f"{hashlib.sha256(data).hexdigest()}-v{SCRIPT_FORMAT}"
+        compiled = compiled_scripts.get(key)
+        if compiled is not None:
+            compiled_scripts.move_to_end(key)
+            return compiled
+
+        cache_file = os.path.join(self.script_cache, key + '.pickle') if self.script_cache else None
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    version, compiled = ScriptUnpickler(f).load()
+                if version != SCRIPT_FORMAT:
+                    compiled = None
+            except Exception:
+                # Поврежденный или несовместимый кэш - компилируем заново
+                compiled = None
+
+        if compiled is None:
+            compiled = self.compile_script(data.decode('utf-8'))
+            if cache_file:
+                try:
+                    os.makedirs(self.script_cache, exist_ok=True)
+                    with open(cache_file, 'wb') as f:
+                        pickle.dump((SCRIPT_FORMAT, compiled), f, protocol=pickle.HIGHEST_PROTOCOL)
+                except OSError as e:
+                    self.print_error(f"Warning: cannot write script cache: {e}")
+
+        compiled_scripts[key] = compiled
+        if len(compiled_scripts) > COMPILED_SCRIPTS_MAX:
+            compiled_scripts.popitem(last=False)
+        return compiled
+
+    def run_script(self, script_path=None):
+        # Выполнение скрипта из файла (по умолчанию - указанного при запуске)
+        script_path = script_path or self.script_path
+        if not script_path or not os.path.exists(script_path):
+            self.print_error(f"Error: Script {script_path} not found")
             return False
 
-        self.print_output(f"# Executing script: {self.script_path}")
+        if not self.quiet:
+            self.print_output(f"# Executing script: {script_path}")
 
         try:
-            with open(self.script_path, 'r', encoding='utf-8') as f:
-                # Читаем скрипт построчно
-                for line_num, line in enumerate(f, 1): # нумерация строк с 1
-                    line = line.strip() # удаление лишних пробелов
-                    # Пропускаем пустые строки и комментарии
-                    if not line or line.startswith('#'):
-                        continue
-                    self.print_output(f"[Script:{line_num}] > {line}")
-
-                    # Передаем is_script=True для остановки при ошибках
-                    success = self.execute_command(line, is_script=True)
-                    if not success and line == "exit":
-                        return True  # exit - нормальное завершение
-                    elif not success:
-                        self.print_output(f"Script stopped at line {line_num} due to error")
-                        return False
-
-            return True
-
+            with open(script_path, 'rb') as f:
+                ops, errors = self.load_compiled_script(f.read())
         except Exception as e:
-            self.print_output(f"Script reading error: {e}")
+            self.print_error(f"Script reading error: {e}")
             return False
 
-    def list_directory(self, args):
-        # Реализация команды ls - список файлов и директорий
-        try:
-            show_details = "-l" in args
-            path_args = [arg for arg in args if arg != "-l"]
+        # Синтаксические ошибки сообщаются до выполнения первой команды
+        if errors:
+            for error in errors:
+                self.print_error(error)
+            return False
 
-            # Определяем целевую директорию
-            if not path_args:
-                target_path = self.current_dir
-            else:
-                target_path = path_args[0]
-                if not target_path.startswith('/'):
-                    # Преобразуем относительный путь в абсолютный
-                    target_path = os.path.join(self.current_dir, target_path).replace('\\', '/')
-
-            # Получаем целевую директорию
-            target_dir = self.get_directory_by_path(target_path)
-            if not target_dir or target_dir["type"] != "directory":
-                self.print_output(f"Error: {target_path} is not a directory")
-                return False
+        if not self.transactional or self.undo_log is not None:
+            return self.run_ops(ops)
 
-            # Формируем список элементов
-            items = []
-            for name, item in target_dir["content"].items():
-                if show_details:
-                    # Подробный вывод с правами и размерами
-                    item_type = "d" if item["type"] == "directory" else "-"
-                    perms = item.get("perms", "???")
-                    if item["type"] == "file":
-                        size = f" {item['size']}b"
-                        items.append(f"{item_type}{perms} {name}{size}")
-                    else:
-                        items.append(f"{item_type}{perms} {name}")
+        # Скрипт целиком в транзакции: при ошибке дерево возвращается к состоянию до запуска
+        self.begin()
+        completed = False
+        try:
+            completed = self.run_ops(ops)
+        finally:
+            if self.undo_log is not None:
+                if completed:
+                    self.commit()
                 else:
-                    # Простой вывод только имен
-                    items.append(name)
-
-            # Выводим результат
-            if items:
-                self.print_output(" ".join(items))
-            else:
-                self.print_output("")
+                    count = self.rollback()
+                    self.print_output(f"Script changes rolled back ({count} changes)")
+        return completed
+
+    def run_ops(self, ops):
+        """Выполнение скомпилированного скрипта"""
+        dispatch = self.dispatch_command
+        echo = not self.quiet
+        # В транзакционном режиме скрипт останавливается и при ошибке команды
+        stop_on_failure = self.transactional
+        for line_num, line, command, args in ops:
+            if echo:
+                self.print_output(f"[Script:{line_num}] > {line}")
+            if command is None:
+                continue
+
+            self.interrupted = False
+            # Передаем is_script=True для остановки при ошибках
+            if not dispatch(command, args, is_script=True):
+                if command == "exit":
+                    return True  # exit - нормальное завершение
+                self.print_error(f"Script stopped at line {line_num} due to error")
+                return False
+            if self.interrupted:
+                # Ctrl+C останавливает весь скрипт, а не только текущую команду
+                self.print_error(f"Script interrupted at line {line_num}")
+                return False
+            if stop_on_failure and self.last_code != EXIT_OK:
+                self.print_error(f"Script stopped at line {line_num} due to error")
+                return False
 
-            return True
+        return True
 
+    def list_directory(self, args):
+        # Реализация команды ls - список файлов и директорий
+        # ls [-l] [-S] [-r] [--sort name|size|none] [--limit N] [--offset N] [путь]
+        try:
+            show_details = reverse = False
+            order = "none" # порядок директории (порядок добавления)
+            limit = None
+            offset = 0
+            path_args = []
+            i = 0
+            while i < len(args):
+                arg = args[i]
+                if arg in ("--sort", "--limit", "--offset"):
+                    if i + 1 >= len(args):
+                        self.print_error(f"Error: {arg} requires a value")
+                        return False
+                    value = args[i + 1]
+                    i += 2
+                    if arg == "--sort":
+                        if value not in ("name", "size", "none"):
+                            self.print_error(f"Error: unknown sort order: {value}")
+                            return False
+                        order = value
+                        continue
+                    try:
+                        number = int(value)
+                    except ValueError:
+                        number = -1
+                    if number < 0:
+                        self.print_error(f"Error: invalid {arg[2:]}: {value}")
+                        return False
+                    if arg == "--limit":
+                        limit = number
+                    else:
+                        offset = number
+                    continue
+                if arg.startswith("-") and len(arg) > 1 and set(arg[1:]) <= set("lSr"):
+                    show_details = show_details or "l" in arg
+                    reverse = reverse or "r" in arg
+                    if "S" in arg:
+                        order = "size"
+                elif arg.startswith("-"):
+                    self.print_error(f"Error: unknown option: {arg}")
+                    return False
+                else:
+                    path_args.append(arg)
+                i += 1
+
+            # Файлы выводятся одной строкой, директории - списком (с заголовком, если путей несколько)
+            success = True
+            files = []
+            directories = []
+            for path in path_args or ["."]:
+                target_path, target = self.resolve_path(path)
+                if not target:
+                    self.print_error(f"Error: {target_path} is not a directory")
+                    success = False
+                elif target.is_dir:
+                    directories.append((target_path, target))
+                else:
+                    files.append(self.format_entry(path, target, show_details))
+            if files:
+                self.print_output(" ".join(files))
+            for target_path, target_dir in directories:
+                if len(path_args) > 1:
+                    self.print_output(f"{target_path}:")
+                self.list_entries(target_dir, show_details, order, reverse, offset, limit)
+            return success
+
+        except KeyboardInterrupt:
+            self.print_error("ls: interrupted")
+            self.interrupted = True
+            return False
         except Exception as e:
-            self.print_output(f"ls error: {e}")
+            self.print_error(f"ls error: {e}")
             return False
 
+    def list_entries(self, target_dir, show_details, order, reverse, offset, limit):
+        """Вывод страницы содержимого директории для ls"""
+        # Имена нужной страницы: срез отсортированного списка без сортировки при каждом вызове
+        content = target_dir.content
+        stop = None if limit is None else offset + limit
+        if order == "none":
+            names = reversed(content) if reverse else content
+            names = itertools.islice(names, offset, stop)
+        else:
+            listing = self.sorted_listing(target_dir, order)
+            if reverse:
+                end = len(listing) - offset
+                listing = listing[max(end - limit, 0) if limit is not None else 0:max(end, 0)][::-1]
+            else:
+                listing = listing[offset:stop]
+            names = listing if order == "name" else (name for _, name in listing)
+
+        # Формируем список элементов
+        items = []
+        written = False
+        for name in names:
+            items.append(self.format_entry(name, content[name], show_details))
+            if len(items) >= STREAM_BATCH:
+                # Большие директории выводятся строками по STREAM_BATCH элементов
+                self.print_output(" ".join(items))
+                items = []
+                written = True
+
+        # Выводим результат
+        if items or not written:
+            self.print_output(" ".join(items))
+
+    def format_entry(self, name, item, show_details):
+        if show_details:
+            # Подробный вывод с правами и размерами
+            item_type = "d" if item.is_dir else "-"
+            perms = item.perms_str()
+            if not item.is_dir:
+                return f"{item_type}{perms} {name} {item.size}b"
+            return f"{item_type}{perms} {name}"
+        # Простой вывод только имен
+        return name
+
     def change_directory(self, args):
         """Реализация команды cd - смена директории"""
         if not args:
-            self.print_output("Error: specify path")
+            self.print_error("Error: specify path")
             return False
 
         path = args[0]
         try:
-            if path == "/":
-                # Переход в корневую директорию
-                self.current_dir = "/"
-            elif path == "..":
-                # Переход на уровень выше
-                if self.current_dir == "/":
-                    self.print_output("Error: already in root directory")
-                    return False
-                else:
-                    parts = self.current_dir.rstrip('/').split('/')
-                    self.current_dir = '/' + '/'.join(parts[:-1]) if len(parts) > 1 else "/"
+            if path == ".." and not self.cwd_parts:
+                self.print_error("Error: already in root directory")
+                return False
+
+            depth, extra = self.split_path(path)
+            new_path = self.components_to_path(depth, extra)
+
+            # Цепочка узлов новой директории продолжает цепочку текущей
+            nodes = self.current_nodes()
+            if nodes is None:
+                nodes = [self.current_vfs]
+                extra = self.cwd_parts[:depth] + extra
+                depth = 0
+            chain = nodes[:depth + 1]
+            target = chain[-1]
+            for part in extra:
+                target = target.content.get(part) if target.is_dir else None
+                if target is None:
+                    break
+                chain.append(target)
+
+            # Проверяем существование целевой директории
+            if target is None:
+                self.print_error(f"Error: path {new_path} does not exist")
+                return False
+            elif not target.is_dir:
+                self.print_error(f"Error: {new_path} is not a directory")
+                return False
+
+            self.cwd_parts = self.cwd_parts[:depth] + extra
+            self.cwd_nodes = chain
+            self.current_dir = new_path
+            return True
+
+        except Exception as e:
+            self.print_error(f"cd error: {e}")
+            return False
+
+    def parse_line_args(self, args):
+        """Разбор аргументов head/tail: (число строк, пути) или None при ошибке"""
+        lines_to_show = 10  # значение по умолчанию
+        file_paths = []
+
+        # Обрабатываем опции командной строки
+        i = 0
+        while i < len(args):
+            if args[i] == "-n" and i + 1 < len(args):
+                try:
+                    lines_to_show = int(args[i + 1])
+                    i += 2
+                except ValueError:
+                    self.print_error(f"Error: invalid number of lines: {args[i + 1]}")
+                    return None
+            elif not args[i].startswith("-"):
+                file_paths.append(args[i])
+                i += 1
             else:
-                # Переход в указанную директорию
-                if path.startswith('/'):
-                    new_path = path
-                else:
-                    new_path = os.path.join(self.current_dir, path).replace('\\', '/')
+                self.print_error(f"Error: unknown option: {args[i]}")
+                return None
 
-                # Проверяем существование целевой директории
-                target = self.get_directory_by_path(new_path)
-                if not target:
-                    self.print_output(f"Error: path {new_path} does not exist")
-                    return False
-                elif target["type"] != "directory":
-                    self.print_output(f"Error: {new_path} is not a directory")
+        # Без файлов читается вывод предыдущей команды конвейера
+        if not file_paths and self.stdin is None:
+            self.print_error("Error: specify file path")
+            return None
+        return lines_to_show, file_paths
+
+    def resolve_file(self, path):
+        """Поиск файла для чтения: (путь, узел) или (путь, None) с выводом ошибки"""
+        file_path, file_item = self.resolve_path(path)
+        if not file_item:
+            self.print_error(f"Error: file {file_path} not found")
+            return file_path, None
+        elif file_item.is_dir:
+            self.print_error(f"Error: {file_path} is not a file")
+            return file_path, None
+        return file_path, file_item
+
+    def head_file(self, args):
+        try:
+            parsed = self.parse_line_args(args)
+            if parsed is None:
+                return False
+            lines_to_show, file_paths = parsed
+            if not file_paths:
+                # Чтение входа прекращается после lines_to_show строк
+                self.stream_output(itertools.islice(self.stdin, max(lines_to_show, 0)))
+                return True
+
+            for file_path in file_paths:
+                # Находим файл в VFS
+                file_path, file_item = self.resolve_file(file_path)
+                if not file_item:
                     return False
-                else:
-                    self.current_dir = new_path
+                if len(file_paths) > 1:
+                    self.print_output(f"==> {file_path} <==")
+
+                # Выводим первые строки: поиск строк останавливается после lines_to_show
+                lines = self.content_view(file_item).lines()
+                self.stream_output(itertools.islice(lines, max(lines_to_show, 0)))
+
             return True
 
+        except KeyboardInterrupt:
+            self.print_error("head: interrupted")
+            self.interrupted = True
+            return False
         except Exception as e:
-            self.print_output(f"cd error: {e}")
+            self.print_error(f"head error: {e}")
             return False
 
-    def head_file(self, args):
+    def tail_file(self, args):
+        """Команда tail [-n N] файл... - последние строки, поиск идет с конца файла"""
         try:
-            # Парсим аргументы
-            lines_to_show = 10  # значение по умолчанию
-            file_path = None
+            parsed = self.parse_line_args(args)
+            if parsed is None:
+                return False
+            lines_to_show, file_paths = parsed
+            if not file_paths:
+                # Вход читается до конца, в памяти только последние строки
+                self.stream_output(deque(self.stdin, maxlen=max(lines_to_show, 0)))
+                return True
 
-            # Обрабатываем опции командной строки
-            i = 0
-            while i < len(args):
-                if args[i] == "-n" and i + 1 < len(args):
-                    try:
-                        lines_to_show = int(args[i + 1])
-                        i += 2
-                    except ValueError:
-                        self.print_output(f"Error: invalid number of lines: {args[i + 1]}")
-                        return False
-                elif not args[i].startswith("-"):
-                    file_path = args[i]
-                    i += 1
-                else:
-                    self.print_output(f"Error: unknown option: {args[i]}")
+            for file_path in file_paths:
+                file_path, file_item = self.resolve_file(file_path)
+                if not file_item:
                     return False
+                if len(file_paths) > 1:
+                    self.print_output(f"==> {file_path} <==")
+
+                lines = list(itertools.islice(self.content_view(file_item).lines_reversed(),
+                                              max(lines_to_show, 0)))
+                lines.reverse()
+                self.stream_output(lines)
+            return True
 
-            if not file_path:
-                self.print_output("Error: specify file path")
+        except KeyboardInterrupt:
+            self.print_error("tail: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"tail error: {e}")
+            return False
+
+    def cat_files(self, args):
+        """Команда cat файл... - потоковый вывод содержимого"""
+        try:
+            if not args and self.stdin is not None:
+                self.stream_output(self.stdin)
+                return True
+            if not args:
+                self.print_error("Error: specify file path")
                 return False
 
-            # Получаем полный путь к файлу
-            if not file_path.startswith('/'):
-                file_path = os.path.join(self.current_dir, file_path).replace('\\', '/')
+            for path in args:
+                file_path, file_item = self.resolve_file(path)
+                if not file_item:
+                    return False
+                self.stream_output(self.content_view(file_item).lines())
+            return True
 
-            # Находим файл в VFS
-            file_item = self.get_directory_by_path(file_path)
+        except KeyboardInterrupt:
+            self.print_error("cat: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"cat error: {e}")
+            return False
+
+    def print_lines(self, args):
+        """Команда sed -n 'a,bp' файл - строки с a по b (b может быть $)"""
+        try:
+            piped = len(args) == 2 and self.stdin is not None
+            if len(args) != 3 and not piped or args[0] != "-n":
+                self.print_error("Error: only sed -n 'a,bp' file is supported")
+                return False
+            match = re.fullmatch(r'(\d+)(?:,(\d+|\$))?p', args[1])
+            if not match or int(match.group(1)) < 1:
+                self.print_error(f"Error: invalid line range: {args[1]}")
+                return False
+            first = int(match.group(1))
+            last = match.group(2) or match.group(1)
+            if piped:
+                last = None if last == "$" else int(last)
+                self.stream_output(itertools.islice(self.stdin, first - 1, last))
+                return True
+
+            file_path, file_item = self.resolve_file(args[2])
             if not file_item:
-                self.print_output(f"Error: file {file_path} not found")
                 return False
-            elif file_item["type"] != "file":
-                self.print_output(f"Error: {file_path} is not a file")
+
+            view = self.content_view(file_item)
+            starts = self.line_index(file_item, view)
+            if starts is None:
+                # Без индекса - сканирование от начала файла
+                last = None if last == "$" else int(last)
+                lines = itertools.islice(view.lines(), first - 1, last)
+            else:
+                last = len(starts) if last == "$" else min(int(last), len(starts))
+                lines = view.line_range(starts, first, last) if first <= last else ()
+            self.stream_output(lines)
+            return True
+
+        except KeyboardInterrupt:
+            self.print_error("sed: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"sed error: {e}")
+            return False
+
+    def grep_lines(self, args):
+        """Команда grep [-v] [-c] шаблон [файл...] - строки, совпадающие с регулярным
+        выражением. Без файлов фильтрует вывод предыдущей команды конвейера"""
+        try:
+            options = []
+            while args and args[0] in ("-v", "-c"):
+                options.append(args[0])
+                args = args[1:]
+            if not args:
+                self.print_error("Error: specify pattern")
+                return False
+            if args[0].startswith("-") and len(args[0]) > 1:
+                self.print_error(f"Error: unknown option: {args[0]}")
+                return False
+            try:
+                search = re.compile(args[0]).search
+            except re.error as e:
+                self.print_error(f"Error: invalid pattern: {e}")
+                return False
+            paths = args[1:]
+            if not paths and self.stdin is None:
+                self.print_error("Error: specify file path")
+                return False
+
+            sources = [self.stdin] if not paths else []
+            for path in paths:
+                file_path, file_item = self.resolve_file(path)
+                if not file_item:
+                    return False
+                sources.append(self.content_view(file_item).lines())
+            lines = itertools.chain.from_iterable(sources)
+            if "-v" in options:
+                matches = (line for line in lines if not search(line))
+            else:
+                matches = (line for line in lines if search(line))
+
+            if "-c" in options:
+                self.print_output(str(sum(1 for _ in matches)))
+            else:
+                self.stream_output(matches)
+            return True
+
+        except KeyboardInterrupt:
+            self.print_error("grep: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"grep error: {e}")
+            return False
+
+    def word_count(self, args):
+        """Команда wc [-l] [-w] [-m] файл... - число строк, слов и символов"""
+        try:
+            options = [arg for arg in args if arg.startswith("-")]
+            paths = [arg for arg in args if not arg.startswith("-")]
+            for option in options:
+                if option not in ("-l", "-w", "-m"):
+                    self.print_error(f"Error: unknown option: {option}")
+                    return False
+            if not paths and self.stdin is None:
+                self.print_error("Error: specify file path")
+                return False
+            # Без опций выводятся все счетчики
+            options = options or ["-l", "-w", "-m"]
+
+            if not paths:
+                # Вход конвейера считается построчно, без сборки в одну строку
+                lines = words = chars = 0
+                for line in self.stdin:
+                    lines += 1
+                    words += len(line.split())
+                    chars += len(line) + 1
+                counts = {"-l": lines, "-w": words, "-m": chars}
+                self.print_output(" ".join(str(counts[option]) for option in ("-l", "-w", "-m")
+                                           if option in options))
+                return True
+
+            for path in paths:
+                file_path, file_item = self.resolve_file(path)
+                if not file_item:
+                    return False
+                view = self.content_view(file_item)
+                lines = view.line_count()
+                words = chars = 0
+                if "-w" in options or "-m" in options:
+                    # Проход блоками по границам строк: в памяти один блок, а не весь файл
+                    for chunk in view.chunks():
+                        words += len(chunk.split())
+                        chars += len(chunk)
+                counts = {"-l": lines, "-w": words, "-m": chars}
+                self.print_output(" ".join(str(counts[option]) for option in ("-l", "-w", "-m")
+                                           if option in options) + f" {file_path}")
+            return True
+
+        except KeyboardInterrupt:
+            self.print_error("wc: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"wc error: {e}")
+            return False
+
+    def export_tree(self, args):
+        """Команда export [--diff] файл.csv - выгрузка дерева в CSV в формате загрузки.
+        --diff - только пути, измененные после загрузки; удаленные пути записываются
+        строками типа removed. Строки такой выгрузки можно дописать в конец исходного CSV"""
+        try:
+            diff = "--diff" in args
+            paths = [arg for arg in args if arg != "--diff"]
+            if len(paths) != 1 or paths[0].startswith("-"):
+                self.print_error("Error: usage: export [--diff] file.csv")
                 return False
+            export_path = paths[0]
+
+            tmp_path = export_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8', newline='', buffering=1024 * 1024) as f:
+                f.write("path,type,perms,size,content\n")
+                rows = self.write_changed_rows(f) if diff else self.write_tree_rows(f, "/", self.current_vfs)
+            os.replace(tmp_path, export_path)
+            self.print_output(f"Exported {rows} rows to {export_path}")
+            return True
 
-            # Получаем содержимое файла и выводим первые строки
-            content = file_item.get("content", "")
-            lines = content.split('\n')
+        except KeyboardInterrupt:
+            self.print_error("export: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"export error: {e}")
+            return False
 
-            for i in range(min(lines_to_show, len(lines))):
-                self.print_output(lines[i])
+    def write_tree_rows(self, f, path, node):
+        """Строки CSV для поддерева в прямом порядке (родитель перед детьми).
+        Возвращает число строк"""
+        rows = 0
+        for item_path, item, _ in self.walk_tree(path, node):
+            if item_path != "/":
+                self.write_csv_row(f, item_path, item)
+                rows += 1
+        return rows
+
+    def write_changed_rows(self, f):
+        """Строки CSV для путей, измененных после загрузки: существующий путь
+        записывается вместе с поддеревом (строка директории при загрузке заменяет
+        прежнюю целиком), отсутствующий - строкой removed"""
+        rows = 0
+        covered = set() # Пути, поддерево которых уже записано целиком
+        # После сортировки родитель идет раньше своих потомков
+        for path in sorted(self.changed_paths):
+            ancestor = path.rsplit('/', 1)[0]
+            while ancestor and ancestor not in covered:
+                ancestor = ancestor.rsplit('/', 1)[0]
+            if ancestor:
+                continue
+            node = self.get_directory_by_path(path)
+            if node is not None:
+                rows += self.write_tree_rows(f, path, node)
+            else:
+                f.write(f"{csv_field(path)},removed,,,\n")
+                rows += 1
+            covered.add(path)
+        return rows
+
+    def write_csv_row(self, f, path, node):
+        """Строка CSV для узла; содержимое кодируется в base64 по блокам,
+        без полной закодированной копии файла"""
+        if node.is_dir:
+            f.write(f"{csv_field(path)},directory,{node.perms_str()},,\n")
+            return
+        f.write(f"{csv_field(path)},file,{node.perms_str()},{node.size},")
+        rest = b""
+        for chunk in self.content_view(node).byte_chunks():
+            data = rest + chunk if rest else chunk
+            # Блок кодируется без выравнивания, если его длина кратна 3
+            cut = len(data) - len(data) % 3
+            f.write(base64.b64encode(data[:cut]).decode('ascii'))
+            rest = data[cut:]
+        f.write(base64.b64encode(rest).decode('ascii'))
+        f.write("\n")
+
+    def begin_transaction(self, args):
+        """Команда begin - начало транзакции"""
+        if args:
+            self.print_error("Error: begin takes no arguments")
+            return False
+        if self.undo_log is not None:
+            self.print_error("Error: transaction already in progress")
+            return False
+        self.begin()
+        self.print_output("Transaction started")
+        return True
 
+    def commit_transaction(self, args):
+        """Команда commit - фиксация изменений транзакции"""
+        if self.undo_log is None:
+            self.print_error("Error: no transaction in progress")
+            return False
+        try:
+            count = self.commit()
+            self.print_output(f"Transaction committed ({count} changes)")
             return True
+        except Exception as e:
+            self.print_error(f"commit error: {e}")
+            return False
 
+    def rollback_transaction(self, args):
+        """Команда rollback - отмена изменений транзакции"""
+        if self.undo_log is None:
+            self.print_error("Error: no transaction in progress")
+            return False
+        try:
+            count = self.rollback()
+            self.print_output(f"Transaction rolled back ({count} changes)")
+            return True
         except Exception as e:
-            self.print_output(f"head error: {e}")
+            self.print_error(f"rollback error: {e}")
             return False
 
+    def show_stats(self, args):
+        """Команда stats - счетчики кэшей и профилирования"""
+        cache = self.path_cache
+        self.print_output(f"path cache: {len(cache.entries)}/{cache.max_entries} entries, "
+                          f"{cache.hits} hits, {cache.misses} misses, {cache.invalidations} invalidations")
+        if self.path_index is not None:
+            self.print_output(f"path index: {len(self.path_index)} paths")
+        unique, unique_bytes, refs = self.blobs.stats()
+        self.print_output(f"blob store: {unique} unique contents, {unique_bytes} bytes, {refs} references")
+        content = self.content_cache
+        if self.lazy_content:
+            self.print_output(f"content cache: {content.used_bytes}/{content.max_bytes} bytes, "
+                              f"{content.hits} hits, {content.misses} misses, {content.evictions} evictions")
+        lines = self.line_indexes
+        if lines.entries:
+            self.print_output(f"line indexes: {len(lines.entries)} files, {lines.used_bytes}/{lines.max_bytes} bytes, "
+                              f"{lines.hits} hits, {lines.misses} misses, {lines.evictions} evictions")
+
+        if self.profiler is None:
+            self.print_output("profiling disabled (start with --profile)")
+            return True
+        report = self.profiler.report()
+        for phase, ms in report["load_phases_ms"].items():
+            self.print_output(f"load {phase}: {ms} ms")
+        for command, stats in sorted(report["commands"].items(), key=lambda item: -item[1]["total_ms"]):
+            self.print_output(f"{command}: {stats['count']} calls, {stats['total_ms']} ms total, "
+                              f"{stats['mean_us']} us mean")
+        walks = report["walks"]
+        self.print_output(f"lookups: {report['lookups']}, walks: {walks['count']} "
+                          f"({walks['steps']} steps, max depth {walks['max_depth']})")
+        return True
+
+    def write_profile(self):
+        """Запись JSON-отчета профилирования при завершении"""
+        if self.profiler is None or not self.profile_path:
+            return
+        report = self.profiler.report()
+        report["path_cache"] = {"entries": len(self.path_cache.entries), "hits": self.path_cache.hits,
+                                "misses": self.path_cache.misses,
+                                "invalidations": self.path_cache.invalidations}
+        if self.lazy_content:
+            report["content_cache"] = {"bytes": self.content_cache.used_bytes, "hits": self.content_cache.hits,
+                                       "misses": self.content_cache.misses,
+                                       "evictions": self.content_cache.evictions}
+        try:
+            with open(self.profile_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            self.print_error(f"Error writing profile: {e}")
+
     def show_date(self, args):
         try:
             # Простая реализация без поддержки форматов
@@ -487,144 +2902,603 @@ class VFSApp: # Запуск в терминале: python3 emulator.py
             self.print_output(formatted_time)
             return True
         except Exception as e:
-            self.print_output(f"date error: {e}")
+            self.print_error(f"date error: {e}")
             return False
 
     def copy_file(self, args):
+        # cp [-r] источник назначение | cp [-r] источник... директория
         try:
-            if len(args) < 2:
-                self.print_output("Error: cp requires source and destination paths")
-                return False
+            recursive = False
+            paths = []
+            for arg in args:
+                if arg in ("-r", "-R"):
+                    recursive = True
+                elif arg.startswith("-"):
+                    self.print_error(f"Error: unknown option: {arg}")
+                    return False
+                else:
+                    paths.append(arg)
 
-            source_path = args[0]
-            dest_path = args[1]
+            if len(paths) < 2:
+                self.print_error("Error: cp requires source and destination paths")
+                return False
 
-            # Получаем полные пути
-            if not source_path.startswith('/'):
-                source_path = os.path.join(self.current_dir, source_path).replace('\\', '/')
-            if not dest_path.startswith('/'):
-                dest_path = os.path.join(self.current_dir, dest_path).replace('\\', '/')
+            # В существующую директорию копируются все источники: их число зависит
+            # от раскрытия шаблона, поэтому один источник обрабатывается так же
+            dest_dir_path, dest_dir = self.resolve_path(paths[-1])
+            if len(paths) > 2 or (dest_dir is not None and dest_dir.is_dir):
+                if not dest_dir or not dest_dir.is_dir:
+                    self.print_error(f"Error: destination directory {dest_dir_path} not found")
+                    return False
+                success = True
+                for source in paths[:-1]:
+                    source_path, source_item = self.resolve_source(source, recursive)
+                    if not source_item:
+                        success = False
+                        continue
+                    name = source_path.rsplit('/', 1)[-1]
+                    success = self.copy_item(source_path, source_item, dest_dir_path, dest_dir, name) and success
+                return success
 
             # Находим исходный файл
-            source_item = self.get_directory_by_path(source_path)
+            source_path, source_item = self.resolve_source(paths[0], recursive)
             if not source_item:
-                self.print_output(f"Error: source file {source_path} not found")
-                return False
-            elif source_item["type"] != "file":
-                self.print_output(f"Error: {source_path} is not a file")
                 return False
 
-            # Определяем директорию назначения и имя нового файла
-            dest_parts = dest_path.strip('/').split('/')
-            dest_dir_path = '/' + '/'.join(dest_parts[:-1]) if len(dest_parts) > 1 else "/"
-            new_filename = dest_parts[-1]
-
-            # Находим директорию назначения
-            dest_dir = self.get_directory_by_path(dest_dir_path)
-            if not dest_dir:
-                self.print_output(f"Error: destination directory {dest_dir_path} not found")
+            # Определяем и находим директорию назначения и имя нового файла
+            dest_dir_path, dest_dir, new_filename = self.resolve_parent(paths[1])
+            dest_path = child_path(dest_dir_path, new_filename or "")
+            if new_filename is None:
+                self.print_error(f"Error: {dest_path} is not a file path")
                 return False
-            elif dest_dir["type"] != "directory":
-                self.print_output(f"Error: {dest_dir_path} is not a directory")
+            if not dest_dir:
+                self.print_error(f"Error: destination directory {dest_dir_path} not found")
                 return False
-
-            # Проверяем, не существует ли уже файл с таким именем
-            if new_filename in dest_dir["content"]:
-                self.print_output(f"Error: file {new_filename} already exists in {dest_dir_path}")
+            elif not dest_dir.is_dir:
+                self.print_error(f"Error: {dest_dir_path} is not a directory")
                 return False
 
-            # Копируем файл (создаем новую запись с теми же данными)
-            dest_dir["content"][new_filename] = {
-                "type": "file",
-                "size": source_item["size"],
-                "content": source_item["content"],
-                "perms": source_item["perms"]
-            }
-
-            self.print_output(f"File copied from {source_path} to {dest_path}")
-            return True
+            return self.copy_item(source_path, source_item, dest_dir_path, dest_dir, new_filename)
 
+        except KeyboardInterrupt:
+            self.print_error("cp: interrupted, nothing copied")
+            self.interrupted = True
+            return False
         except Exception as e:
-            self.print_output(f"cp error: {e}")
+            self.print_error(f"cp error: {e}")
             return False
 
+    def resolve_source(self, path, recursive):
+        """Источник копирования: (путь, узел) или (путь, None) с выводом ошибки"""
+        source_path, source_item = self.resolve_path(path)
+        if not source_item:
+            self.print_error(f"Error: source file {source_path} not found")
+            return source_path, None
+        elif source_item.is_dir and not recursive:
+            self.print_error(f"Error: {source_path} is not a file")
+            return source_path, None
+        return source_path, source_item
+
+    def copy_item(self, source_path, source_item, dest_dir_path, dest_dir, new_filename):
+        dest_path = child_path(dest_dir_path, new_filename)
+        # Проверяем, не существует ли уже файл с таким именем
+        if new_filename in dest_dir.content:
+            self.print_error(f"Error: file {new_filename} already exists in {dest_dir_path}")
+            return False
+
+        # Копируем файл (новая запись ссылается на то же содержимое)
+        count = self.copy_node(source_item, dest_dir, dest_dir_path, new_filename)
+        self.record_mutation("copy", dest_path, source=source_path)
+
+        if source_item.is_dir:
+            self.print_output(f"Directory copied from {source_path} to {dest_path} ({count} items)")
+        else:
+            self.print_output(f"File copied from {source_path} to {dest_path}")
+        return True
+
     def remove_directory(self, args):
         #Реализация команды rmdir - удаление пустых директорий
         try:
             if len(args) < 1:
-                self.print_output("Error: rmdir requires directory path")
+                self.print_error("Error: rmdir requires directory path")
                 return False
 
-            dir_path = args[0]
+            success = True
+            for path in args:
+                success = self.remove_empty_directory(path) and success
+            return success
 
-            # Получаем полный путь
-            if not dir_path.startswith('/'):
-                dir_path = os.path.join(self.current_dir, dir_path).replace('\\', '/')
+        except Exception as e:
+            self.print_error(f"rmdir error: {e}")
+            return False
 
-            # Нельзя удалить корневую директорию
-            if dir_path == "/":
-                self.print_output("Error: cannot remove root directory")
-                return False
+    def remove_empty_directory(self, path):
+        # Находим родительскую директорию и имя удаляемой
+        parent_dir_path, parent_dir, dir_name = self.resolve_parent(path)
 
-            # Находим директорию для удаления
-            dir_parts = dir_path.strip('/').split('/')
-            parent_dir_path = '/' + '/'.join(dir_parts[:-1]) if len(dir_parts) > 1 else "/"
-            dir_name = dir_parts[-1]
+        # Нельзя удалить корневую директорию
+        if dir_name is None:
+            self.print_error("Error: cannot remove root directory")
+            return False
+        dir_path = child_path(parent_dir_path, dir_name)
 
-            parent_dir = self.get_directory_by_path(parent_dir_path)
-            if not parent_dir:
-                self.print_output(f"Error: parent directory {parent_dir_path} not found")
-                return False
+        if not parent_dir:
+            self.print_error(f"Error: parent directory {parent_dir_path} not found")
+            return False
 
-            if dir_name not in parent_dir["content"]:
-                self.print_output(f"Error: directory {dir_path} not found")
-                return False
+        if not parent_dir.is_dir or dir_name not in parent_dir.content:
+            self.print_error(f"Error: directory {dir_path} not found")
+            return False
 
-            target_dir = parent_dir["content"][dir_name]
-            if target_dir["type"] != "directory":
-                self.print_output(f"Error: {dir_path} is not a directory")
-                return False
+        target_dir = parent_dir.content[dir_name]
+        if not target_dir.is_dir:
+            self.print_error(f"Error: {dir_path} is not a directory")
+            return False
 
-            # Проверяем, что директория пуста
-            if target_dir["content"]:
-                self.print_output(f"Error: directory {dir_path} is not empty")
+        # Проверяем, что директория пуста
+        if target_dir.content:
+            self.print_error(f"Error: directory {dir_path} is not empty")
+            return False
+
+        # Удаляем директорию
+        self.remove_node(parent_dir, parent_dir_path, dir_name)
+        self.record_mutation("remove", dir_path)
+        self.print_output(f"Directory {dir_path} removed")
+        return True
+
+    def remove_items(self, args):
+        """Команда rm [-r] [-f] путь... - удаление файлов и (с -r) директорий с содержимым"""
+        try:
+            recursive = force = False
+            paths = []
+            for arg in args:
+                if arg.startswith("-") and len(arg) > 1 and set(arg[1:]) <= set("rRf"):
+                    recursive = recursive or "r" in arg or "R" in arg
+                    force = force or "f" in arg
+                elif arg.startswith("-"):
+                    self.print_error(f"Error: unknown option: {arg}")
+                    return False
+                else:
+                    paths.append(arg)
+
+            if not paths:
+                self.print_error("Error: rm requires a path")
                 return False
 
-            # Удаляем директорию
-            del parent_dir["content"][dir_name]
-            self.print_output(f"Directory {dir_path} removed")
-            return True
+            success = True
+            for path in paths:
+                parent_path, parent, name = self.resolve_parent(path)
+                if name is None:
+                    self.print_error("Error: cannot remove root directory")
+                    success = False
+                    continue
+                item_path = child_path(parent_path, name)
+                item = parent.content.get(name) if parent and parent.is_dir else None
+                if item is None:
+                    if not force:
+                        self.print_error(f"Error: {item_path} not found")
+                        success = False
+                    continue
+                if item.is_dir and not recursive:
+                    self.print_error(f"Error: {item_path} is a directory (use rm -r)")
+                    success = False
+                    continue
+
+                # Подсчет до изменения дерева: прерывание обхода ничего не удаляет
+                count = sum(1 for _ in self.walk_tree(item_path, item))
+                self.remove_node(parent, parent_path, name)
+                self.record_mutation("remove", item_path)
+                if item.is_dir:
+                    self.print_output(f"Directory {item_path} removed ({count} items)")
+                else:
+                    self.print_output(f"File {item_path} removed")
+            return success
 
+        except KeyboardInterrupt:
+            self.print_error("rm: interrupted")
+            self.interrupted = True
+            return False
         except Exception as e:
-            self.print_output(f"rmdir error: {e}")
+            self.print_error(f"rm error: {e}")
             return False
 
+    def find_items(self, args):
+        """Команда find [путь...] [-name шаблон] [-type f|d] [-maxdepth N]"""
+        try:
+            paths = []
+            pattern = item_type = max_depth = None
+            i = 0
+            while i < len(args):
+                arg = args[i]
+                if arg in ("-name", "-type", "-maxdepth"):
+                    if i + 1 >= len(args):
+                        self.print_error(f"Error: {arg} requires a value")
+                        return False
+                    value = args[i + 1]
+                    i += 2
+                    if arg == "-name":
+                        pattern = value
+                    elif arg == "-type":
+                        if value not in ("f", "d"):
+                            self.print_error("Error: -type must be f or d")
+                            return False
+                        item_type = value
+                    else:
+                        try:
+                            max_depth = int(value)
+                        except ValueError:
+                            self.print_error(f"Error: invalid depth: {value}")
+                            return False
+                elif arg.startswith("-"):
+                    self.print_error(f"Error: unknown option: {arg}")
+                    return False
+                else:
+                    paths.append(arg)
+                    i += 1
+
+            want_dir = item_type == "d"
+
+            def matches(root_path, root):
+                for item_path, item, _ in self.walk_tree(root_path, root, max_depth):
+                    if item_type is not None and item.is_dir != want_dir:
+                        continue
+                    if pattern is not None and not fnmatch.fnmatchcase(item_path.rsplit('/', 1)[-1], pattern):
+                        continue
+                    yield item_path
+
+            success = True
+            for path in paths or ["."]:
+                root_path, root = self.resolve_path(path)
+                if not root:
+                    self.print_error(f"Error: {root_path} not found")
+                    success = False
+                    continue
+                self.stream_output(matches(root_path, root))
+            return success
+
+        except KeyboardInterrupt:
+            self.print_error("find: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"find error: {e}")
+            return False
+
+    def disk_usage(self, args):
+        """Команда du [-s] [-a] [путь...] - суммарный размер файлов по директориям"""
+        try:
+            summary = "-s" in args
+            all_files = "-a" in args
+            path_args = [arg for arg in args if arg not in ("-s", "-a")]
+            for arg in path_args:
+                if arg.startswith("-"):
+                    self.print_error(f"Error: unknown option: {arg}")
+                    return False
+
+            def usage(root_path, root):
+                # Обход в обратном порядке: размер директории выводится после ее содержимого
+                sizes = [0] # Суммы открытых директорий (нижний элемент - итог)
+                stack = [(root_path, root, False)]
+                while stack:
+                    item_path, item, done = stack.pop()
+                    if done:
+                        total = sizes.pop()
+                        sizes[-1] += total
+                        if not summary or item is root:
+                            yield f"{total}\t{item_path}"
+                    elif item.is_dir:
+                        sizes.append(0)
+                        stack.append((item_path, item, True))
+                        prefix = item_path.rstrip('/') + '/'
+                        stack.extend((prefix + name, child, False)
+                                     for name, child in reversed(item.content.items()))
+                    else:
+                        sizes[-1] += item.size
+                        if item is root or (all_files and not summary):
+                            yield f"{item.size}\t{item_path}"
+
+            success = True
+            for path in path_args or ["."]:
+                root_path, root = self.resolve_path(path)
+                if not root:
+                    self.print_error(f"Error: {root_path} not found")
+                    success = False
+                    continue
+                self.stream_output(usage(root_path, root))
+            return success
+
+        except KeyboardInterrupt:
+            self.print_error("du: interrupted")
+            self.interrupted = True
+            return False
+        except Exception as e:
+            self.print_error(f"du error: {e}")
+            return False
+
+    def split_path(self, path):
+        """Разбор пути на компоненты: (сколько компонентов текущей директории
+        сохраняется, список компонентов после них). Обрабатывает '.', '..',
+        повторные и завершающие '/'"""
+        depth = 0 if path.startswith('/') else len(self.cwd_parts)
+        extra = []
+        for part in path.split('/'):
+            if not part or part == '.':
+                continue
+            if part == '..':
+                if extra:
+                    extra.pop()
+                elif depth:
+                    depth -= 1
+            else:
+                extra.append(part)
+        return depth, extra
+
+    def components_to_path(self, depth, extra):
+        """Нормализованный абсолютный путь из результата split_path"""
+        if depth == len(self.cwd_parts) and depth:
+            # Путь внутри текущей директории - без повторной сборки ее компонентов
+            return self.current_dir + '/' + '/'.join(extra) if extra else self.current_dir
+        if depth:
+            return '/' + '/'.join(self.cwd_parts[:depth] + extra)
+        return '/' + '/'.join(extra)
+
+    def current_nodes(self):
+        """Цепочка узлов текущей директории (перестраивается после удалений)"""
+        if self.cwd_nodes is None:
+            nodes = [self.current_vfs]
+            for part in self.cwd_parts:
+                node = nodes[-1].content.get(part) if nodes[-1].is_dir else None
+                if node is None:
+                    # Текущая директория удалена - разрешаем пути от корня
+                    return None
+                nodes.append(node)
+            if not nodes[-1].is_dir:
+                # На месте текущей директории теперь файл - как и при удалении
+                return None
+            self.cwd_nodes = nodes
+        return self.cwd_nodes
+
+    def lookup_components(self, depth, extra):
+        """Поиск узла по результату split_path"""
+        nodes = self.current_nodes() if depth else None
+        if nodes is None:
+            # Абсолютный путь - через кэш и индексы
+            node = self.get_directory_by_path(self.components_to_path(depth, extra))
+            if depth and not extra and node is not None and not node.is_dir:
+                # '.' или '..' текущей директории, на месте которой теперь файл
+                return None
+            return node
+
+        # Относительный путь - от сохраненного узла текущей директории
+        if self.profiler is not None:
+            self.profiler.lookups["relative"] += 1
+        node = nodes[depth]
+        for part in extra:
+            if not node.is_dir:
+                return None
+            node = node.content.get(part)
+            if node is None:
+                return None
+        return node
+
+    def resolve_path(self, path):
+        """Разрешение пути: (нормализованный абсолютный путь, узел или None)"""
+        depth, extra = self.split_path(path)
+        return self.components_to_path(depth, extra), self.lookup_components(depth, extra)
+
+    def resolve_parent(self, path):
+        """Разрешение родительской директории: (путь родителя, узел родителя, имя).
+        Для корня имя равно None"""
+        depth, extra = self.split_path(path)
+        if extra:
+            name = extra.pop()
+        elif depth:
+            name = self.cwd_parts[depth - 1]
+            depth -= 1
+        else:
+            return "/", self.current_vfs, None
+        return self.components_to_path(depth, extra), self.lookup_components(depth, extra), name
+
     def get_directory_by_path(self, path):
         if path == "/":
-            return self.current_vfs.get("/")
-
+            return self.current_vfs
+        if path.endswith('/'):
+            path = path.rstrip('/')
+
+        profiler = self.profiler
+        node = self.path_cache.get(path)
+        if node is not None:
+            if profiler is not None:
+                profiler.lookups["cache"] += 1
+            return node
+
+        if self.path_index is not None:
+            node = self.path_index.get(path)
+        elif self.image is not None and not self.owned_nodes:
+            # Быстрый поиск по хеш-индексу образа, если путь не затронут изменениями
+            node = self.lookup_image_path(path)
+        if node is None:
+            node = self.walk_path(path)
+            if profiler is not None:
+                profiler.lookups["walk"] += 1
+        elif profiler is not None:
+            profiler.lookups["index"] += 1
+
+        if node is not None:
+            self.path_cache.put(path, node)
+        return node # элемент VFS
+
+    def walk_path(self, path):
+        """Поиск элемента обходом дерева от корня"""
         # Разбиваем путь на компоненты и ищем элемент
         parts = path.strip('/').split('/')
-        current = self.current_vfs.get("/")
+        current = self.current_vfs
 
+        steps = 0
         for part in parts:
-            if not part or not current or current["type"] != "directory":
-                return None
-            current = current["content"].get(part)
+            if not part or not current or not current.is_dir:
+                current = None
+                break
+            current = current.content.get(part)
+            steps += 1
+
+        if self.profiler is not None:
+            self.profiler.record_walk(len(parts), steps)
+        return current
+
+    def lookup_image_path(self, path):
+        if self.image_removed:
+            prefix = path
+            while prefix:
+                if prefix in self.image_removed:
+                    return None
+                prefix = prefix.rsplit('/', 1)[0]
+        return self.image.lookup(path)
+
+    async def handle_session(self, reader, writer):
+        """Обслуживание одного подключения: команда в строке, ответ - строка JSON"""
+        session = self.fork_session()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                result = session.execute(line.decode('utf-8', errors='replace'))
+                response = {"code": result.code, "output": result.output}
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+                if result.exit:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start_server(self, host='127.0.0.1', port=None, unix_path=None):
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_session, path=unix_path)
+        return await asyncio.start_server(self.handle_session, host=host, port=port)
+
+    def serve(self, host='127.0.0.1', port=None, unix_path=None):
+        """Режим сервера: все подключения работают с одним загруженным деревом"""
+        async def main():
+            server = await self.start_server(host, port, unix_path)
+            address = unix_path or f"{host}:{port}"
+            self.print_output(f"Serving VFS on {address}")
+            self.output.flush()
+            async with server:
+                await server.serve_forever()
 
-        return current # элемент VFS
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            self.print_output("\nShutting down...")
+        finally:
+            self.write_profile()
+            self.close()
+            self.output.flush()
+            if unix_path and os.path.exists(unix_path):
+                os.remove(unix_path)
+        return 0
+
+    def run_batch(self, scripts, directories, workers=None):
+        """Пакетный режим: каждый скрипт выполняется в каждой рабочей директории
+        в отдельной сессии. Сессии распределяются по процессам; при fork процессы
+        наследуют загруженное дерево без копирования. Изменения сессий затем
+        применяются к дереву (и журналу) в порядке запусков.
+        Возвращает код завершения процесса"""
+        global batch_app
+        try:
+            # Синтаксические ошибки сообщаются до запуска процессов; при fork
+            # скомпилированные скрипты наследуются процессами
+            for script_path in scripts:
+                with open(script_path, 'rb') as f:
+                    _, errors = self.load_compiled_script(f.read())
+                for error in errors:
+                    self.print_output(f"{script_path}: {error}")
+                if errors:
+                    return 1
+
+            expanded = []
+            for directory in directories:
+                if GLOB_CHARS.search(directory):
+                    expanded.extend(self.expand_glob(directory.rstrip('/') + '/'))
+                else:
+                    expanded.append(directory)
+            jobs = [(script_path, directory) for script_path in scripts for directory in expanded]
+            if not jobs:
+                self.print_error("Error: no directories to run in")
+                return 1
+
+            workers = min(workers or os.cpu_count() or 1, len(jobs))
+            batch_app = self
+            self.output.flush()
+            start = time.perf_counter()
+            if workers == 1:
+                results = [run_batch_job(script_path, directory) for script_path, directory in jobs]
+            else:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else None)
+                # Без fork процессы загружают дерево из тех же источников
+                options = None if "fork" in methods else self.batch_options()
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=init_batch_worker, initargs=(options,)) as pool:
+                    futures = [pool.submit(run_batch_job, script_path, directory)
+                               for script_path, directory in jobs]
+                    results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - start
+        except KeyboardInterrupt:
+            self.print_error("batch: interrupted")
+            return 1
+        except Exception as e:
+            self.print_error(f"batch error: {e}")
+            return 1
+        finally:
+            batch_app = None
+
+        failed = 0
+        busy = {} # процесс -> [число запусков, суммарное время]
+        for (script_path, directory), (pid, seconds, ok, output, mutations) in zip(jobs, results):
+            self.print_output(f"==> {directory}: {script_path} <==")
+            self.output.write_lines(output)
+            for record in mutations:
+                try:
+                    self.apply_journal_record(record)
+                    fields = dict(record)
+                    self.record_mutation(fields.pop("op"), fields.pop("path"), **fields)
+                except Exception as e:
+                    self.print_error(f"Error applying {record['op']} {record['path']}: {e}")
+                    ok = False
+            failed += not ok
+            stats = busy.setdefault(pid, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+        self.print_output(f"Batch: {len(jobs)} runs ({failed} failed), {workers} workers, "
+                          f"{elapsed:.3f} s, {len(jobs) / elapsed:.1f} runs/s")
+        for pid, (runs, seconds) in sorted(busy.items()):
+            self.print_output(f"  worker {pid}: {runs} runs, {seconds:.3f} s")
+        self.output.flush()
+        return 1 if failed else 0
+
+    def batch_options(self):
+        """Параметры загрузки дерева в процессе, запущенном без fork"""
+        return {"vfs_path": self.vfs_path, "vfs_csv": self.vfs_csv, "vfs_image": self.vfs_image,
+                "lazy_content": self.lazy_content, "persist": self.persist}
 
     def run_interactive(self):
         # интерактивный режим
         username = getpass.getuser()
         hostname = socket.gethostname()
 
-        self.print_output("\nInteractive mode. Type 'exit' to quit")
+        if not self.quiet:
+            self.print_output("\nInteractive mode. Type 'exit' to quit")
 
         while True:
             try:
                 # Формируем приглашение командной строки
                 prompt = f"{username}@{hostname}:{self.current_dir}$ "
+                self.output.flush() # Вывод предыдущей команды до приглашения
                 command = input(prompt).strip()
 
                 # Выполняем команду (is_script=False - продолжаем при ошибках)
@@ -640,6 +3514,30 @@ class VFSApp: # Запуск в терминале: python3 emulator.py
                 break
 
 
+def init_batch_worker(options):
+    """Подготовка процесса пакетного режима. options - параметры загрузки
+    дерева, если процесс не унаследовал его через fork"""
+    global batch_app
+    if options is not None:
+        batch_app = VFSApp(quiet=True, output=NullSink(), **options)
+        batch_app.close()
+    else:
+        # Унаследованные файлы общие с родителем: журнал не пишется,
+        # CSV открывается заново (смещение чтения у родителя свое)
+        batch_app.journal = None
+        batch_app._csv_handle = None
+
+
+def run_batch_job(script_path, directory):
+    """Выполнение скрипта в новой сессии с текущей директорией directory.
+    Возвращает (pid, секунды, успех, строки вывода, изменения)"""
+    start = time.perf_counter()
+    session = batch_app.fork_session()
+    session.mutations = []
+    ok = session.change_directory([directory]) and session.run_script(script_path)
+    return os.getpid(), time.perf_counter() - start, ok, session.output.lines, session.mutations
+
+
 def parse_arguments():
     """Парсинг аргументов командной строки"""
     parser = argparse.ArgumentParser(description='VFS Emulator')
@@ -649,20 +3547,123 @@ def parse_arguments():
                         help='Path to startup script')
     parser.add_argument('--vfs-csv', '-c', type=str,
                         help='Path to VFS CSV source file')
+    parser.add_argument('--lazy-content', action='store_true',
+                        help='Decode file contents from CSV on first access')
+    parser.add_argument('--content-cache-size', type=int, default=64 * 1024 * 1024,
+                        help='Decoded content cache size in bytes (lazy mode)')
+    parser.add_argument('--line-index-size', type=int, default=16 * 1024 * 1024,
+                        help='Memory for per-file line indexes used by sed in bytes (0 disables)')
+    parser.add_argument('--listing-cache-size', type=int, default=256 * 1024 * 1024,
+                        help='Memory for sorted directory listings used by ls -S/--sort in bytes')
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help='Worker processes for parsing the CSV (one row per line required)')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='Print memory usage per VFS node after loading')
+    parser.add_argument('--vfs-image', '-i', type=str,
+                        help='Path to compiled binary VFS image (see compile-image)')
+    parser.add_argument('--path-cache-size', type=int, default=4096,
+                        help='Number of resolved paths kept in the LRU cache (0 disables)')
+    parser.add_argument('--path-index', action='store_true',
+                        help='Build a full path -> node index at load time')
+    parser.add_argument('--script-cache', type=str,
+                        help='Directory for cached compiled scripts (must not be writable by untrusted users)')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Do not print the startup banner and script command echo')
+    parser.add_argument('--output-buffer', type=int, default=64 * 1024,
+                        help='Output buffer size in characters (0 writes every line)')
+    parser.add_argument('--profile', nargs='?', const='vfs_profile.json',
+                        help='Collect timings and write a JSON report at exit (default vfs_profile.json)')
+    parser.add_argument('--persist', action='store_true',
+                        help='Keep changes in --vfs-path as a journal with periodic snapshots')
+    parser.add_argument('--snapshot-every', type=int, default=10000,
+                        help='Journal records between compacted snapshots (0 disables)')
+    parser.add_argument('--fsync-every', type=int, default=1,
+                        help='fsync the journal every N records (0 never fsyncs)')
+    parser.add_argument('--transactional', action='store_true',
+                        help='Run the script in a transaction: stop at the first failed command and roll back')
+    parser.add_argument('--export', type=str, metavar='CSV',
+                        help='Write the tree to this CSV after the script (same format as --vfs-csv)')
+    parser.add_argument('--export-diff', action='store_true',
+                        help='With --export, write only paths changed since loading')
+    parser.add_argument('--batch-dirs', nargs='+', metavar='DIR',
+                        help='Run the script in each of these directories (wildcards allowed) and exit')
+    parser.add_argument('--batch-scripts', nargs='+', metavar='SCRIPT',
+                        help='Scripts for batch mode (default: --script)')
+    parser.add_argument('--batch-workers', type=int,
+                        help='Worker processes for batch mode (default: CPU count)')
+    parser.add_argument('--serve-port', type=int,
+                        help='Serve sessions over localhost TCP on this port')
+    parser.add_argument('--serve-unix', type=str,
+                        help='Serve sessions over a Unix socket at this path')
     return parser.parse_args()
 
 
+def compile_image_main(argv):
+    """Команда compile-image: преобразование CSV в бинарный образ"""
+    parser = argparse.ArgumentParser(prog='emulator.py compile-image',
+                                     description='Compile VFS CSV into a binary image')
+    parser.add_argument('csv', help='Path to VFS CSV source file')
+    parser.add_argument('image', help='Path to output image file')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.csv):
+        print(f"Error: VFS CSV file '{args.csv}' not found")
+        return 1
+    app = VFSApp()
+    app.vfs_csv = args.csv
+    if not app.load_vfs_from_csv():
+        return 1
+    count = write_image(app.current_vfs, args.image, app.read_file_content)
+    print(f"Image written to {args.image}: {count} nodes")
+    return 0
+
+
 if __name__ == "__main__":
     # Точка входа в программу
+    if len(sys.argv) > 1 and sys.argv[1] == "compile-image":
+        sys.exit(compile_image_main(sys.argv[2:]))
+
     args = parse_arguments()
 
     # Вывод информации о параметрах запуска
-    print("=" * 50)
-    print("Emulator startup parameters:")
-    print(f"VFS path: {args.vfs_path}")
-    print(f"Script: {args.script if args.script else 'Not specified'}")
-    print(f"VFS CSV: {args.vfs_csv if args.vfs_csv else 'Default VFS'}")
-    print("=" * 50)
+    if not args.quiet:
+        print("=" * 50)
+        print("Emulator startup parameters:")
+        print(f"VFS path: {args.vfs_path}")
+        print(f"Script: {args.script if args.script else 'Not specified'}")
+        print(f"VFS CSV: {args.vfs_csv if args.vfs_csv else 'Default VFS'}")
+        if args.vfs_image:
+            print(f"VFS image: {args.vfs_image}")
+        print("=" * 50)
 
     # Создание и запуск приложения VFS
-    app = VFSApp(vfs_path=args.vfs_path, script_path=args.script, vfs_csv=args.vfs_csv)
\ No newline at end of file
+    try:
+        app = VFSApp(vfs_path=args.vfs_path, script_path=args.script, vfs_csv=args.vfs_csv,
+                     lazy_content=args.lazy_content, content_cache_size=args.content_cache_size,
+                     memory_report=args.memory_report, vfs_image=args.vfs_image,
+                     path_cache_size=args.path_cache_size, path_index=args.path_index,
+                     script_cache=args.script_cache, quiet=args.quiet, load_workers=args.load_workers,
+                     profile=args.profile, persist=args.persist, snapshot_every=args.snapshot_every,
+                     fsync_every=args.fsync_every, line_index_size=args.line_index_size,
+                     listing_cache_size=args.listing_cache_size, transactional=args.transactional,
+                     export_path=args.export, export_diff=args.export_diff,
+                     output=BufferedSink(sys.stdout, args.output_buffer))
+    except JournalError as e:
+        # С --persist нельзя работать с частично восстановленным деревом
+        print(e)
+        sys.exit(1)
+    if args.batch_dirs or args.batch_scripts:
+        scripts = args.batch_scripts or ([args.script] if args.script else [])
+        if not scripts:
+            print("Error: batch mode requires --script or --batch-scripts")
+            sys.exit(1)
+        try:
+            code = app.run_batch(scripts, args.batch_dirs or ["/"], args.batch_workers)
+        finally:
+            app.write_profile()
+            app.close()
+            app.output.flush()
+        sys.exit(code)
+    if args.serve_port or args.serve_unix:
+        sys.exit(app.serve(port=args.serve_port, unix_path=args.serve_unix))
+    sys.exit(app.run())
\ No newline at end of file
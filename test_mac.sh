@@ -4,3 +4,12 @@ python emulator.py --vfs-path ./test_vfs --script test2.vfs
 python emulator.py --vfs-path ./test_vfs --script test3.vfs
 python emulator.py --vfs-path ./test_vfs --script test4.vfs
 python emulator.py --vfs-path ./test_vfs --script test5.vfs
+python emulator.py --vfs-path ./test_vfs --script test6.vfs
+python emulator.py --vfs-path ./test_vfs --script test7.vfs
+python emulator.py --vfs-path ./test_vfs --script test8.vfs
+python emulator.py --vfs-path ./test_vfs --script test9.vfs
+python emulator.py --vfs-path ./test_vfs --script test10.vfs
+python emulator.py --vfs-path ./test_vfs --script test11.vfs --batch-dirs /home/user /etc /var
+python emulator.py --vfs-path ./test_vfs --script test12.vfs
+python emulator.py --vfs-path ./test_vfs --script test13.vfs
+python emulator.py --vfs-path ./test_vfs --vfs-csv test_export.csv --script test3.vfs --export test_export_diff.csv --export-diff
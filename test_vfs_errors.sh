@@ -33,7 +33,27 @@ EOF
 timeout 2s python emulator.py --vfs-csv vfs_error_tests/mixed_data.csv || true
 echo ""
 
-echo "=== Phase 4: Testing with Script ==="
+echo "=== Phase 4: Invalid Permissions ==="
+cat > vfs_error_tests/bad_perms.csv << 'EOF'
+path,type,perms,size,content
+/home,directory,755,,
+/home/user,directory,rwxr-xr-x,,
+/home/user/file1.txt,file,640,5,SGVsbG8=
+/home/user/bad_perms.txt,file,rw-r--r--,5,SGVsbG8=
+EOF
+printf 'ls -l /home\nls -l /home/user\n' > vfs_error_tests/perms_script.vfs
+python emulator.py --vfs-csv vfs_error_tests/bad_perms.csv --script vfs_error_tests/perms_script.vfs < /dev/null \
+    | tee vfs_error_tests/perms_output.txt
+if grep -q "Warning in row 2: invalid perms 'rwxr-xr-x', using 755" vfs_error_tests/perms_output.txt \
+    && grep -q "Warning in row 4: invalid perms 'rw-r--r--', using 644" vfs_error_tests/perms_output.txt \
+    && grep -q -- "-640 file1.txt" vfs_error_tests/perms_output.txt; then
+    echo "Invalid permissions reported: OK"
+else
+    echo "Invalid permissions not reported: FAILED"
+fi
+echo ""
+
+echo "=== Phase 5: Testing with Script ==="
 cat > vfs_error_tests/test_script.vfs << 'EOF'
 ls
 cd home